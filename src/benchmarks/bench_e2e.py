@@ -0,0 +1,319 @@
+# imports
+import os
+import sys
+import json
+import time
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import datetime
+import subprocess
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from fake_discord import FakeDiscord
+from fake_controller import FakeController
+
+
+# benchmark
+"""
+end-to-end throughput and latency of the subbot, fully offline: the subbot runs as a subprocess against a local
+fake discord API / gateway (fake_discord.py) and a scripted main bot on its IPC port (fake_controller.py), which
+pushes REPEAT commands round robin over the channels. reported: p50 / p99 command latency (controller sent the
+frame -> RESULT, i.e. after discord acknowledged the message), commands and messages per second, RSS of the
+subbot and event loop lag (from its metrics endpoint); results are written as json to compare runs.
+the fakes share one process with the harness, with very large windows they can become the bottleneck.
+--shard-mode auto / processes runs the subbot sharded (SHARD_MODE); every process registers its guilds with the
+fake controller, which routes each command to the process owning the channel, RSS is summed over the process tree.
+--members fills the fake guilds with members and presences, which the subbot only receives and caches with the
+intents of --intents-profile all; READY time, RSS and cached objects right after startup show what that costs;
+run with: python bench_e2e.py [--channels 50] [--requests 20000] [--window 256] [--output bench_e2e.json]
+                              [--shard-mode processes --shards 4 --shard-processes 4]
+                              [--intents-profile all --members 5000]
+"""
+BOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'discord_bot')
+
+
+def free_ports(count: int = 1) -> int:
+    """first of count consecutive free ports, sharded workers use metrics port + worker index"""
+    while True:
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+
+        try:
+            for offset in range(1, count):
+                with socket.socket() as sock:
+                    sock.bind(('127.0.0.1', port + offset))
+        except OSError:
+            continue
+        return port
+
+
+def percentile(values: List[float], fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+
+def process_tree(pid: int) -> List[int]:
+    """pid and the pids of all its descendants, e.g. the workers of the shard supervisor"""
+    parents = {}
+    for name in os.listdir('/proc'):
+        if not name.isdigit():
+            continue
+        try:
+            with open(f'/proc/{name}/stat') as file:
+                # the command name in parentheses may contain spaces, the parent pid is the second field after it
+                parents[int(name)] = int(file.read().rsplit(')', 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            pass
+
+    pids = [pid]
+    for parent in pids:
+        pids.extend(child for child, child_parent in parents.items() if child_parent == parent)
+    return pids
+
+
+def read_memory(pid: int) -> Dict[str, int]:
+    """current and peak resident set size in kB, summed over the process tree"""
+    memory = {'VmRSS': 0, 'VmHWM': 0}
+    for process_id in process_tree(pid):
+        try:
+            with open(f'/proc/{process_id}/status') as file:
+                for line in file:
+                    if line.startswith(('VmRSS:', 'VmHWM:')):
+                        name, value = line.split(':', 1)
+                        memory[name] += int(value.split()[0])
+        except OSError:
+            pass
+    return memory
+
+
+def working_directory(directory: str) -> str:
+    """the subbot expects ../logging.conf and ./ext; link them so logs and the database stay out of the tree
+
+    ext is copied, the subbot writes its extension manifest and manifest cache there
+    """
+    bot_dir = os.path.join(directory, 'discord_bot')
+    os.makedirs(bot_dir)
+    os.symlink(os.path.abspath(os.path.join(BOT_DIR, '..', 'logging.conf')), os.path.join(directory, 'logging.conf'))
+    for name in os.listdir(BOT_DIR):
+        if name == 'ext':
+            shutil.copytree(os.path.join(BOT_DIR, name), os.path.join(bot_dir, name),
+                            ignore=shutil.ignore_patterns('__pycache__', '.manifest_cache.json'))
+        elif name not in ('logs', '__pycache__', '.env') and not name.endswith('.db'):
+            os.symlink(os.path.abspath(os.path.join(BOT_DIR, name)), os.path.join(bot_dir, name))
+    return bot_dir
+
+
+async def scrape(session: aiohttp.ClientSession, url: str) -> Dict[str, float]:
+    """unlabelled and histogram samples of the metrics endpoint, keyed by their full name including labels"""
+    try:
+        async with session.get(url) as response:
+            text = await response.text()
+    except aiohttp.ClientError:
+        return {}
+
+    samples = {}
+    for line in text.splitlines():
+        if line and not line.startswith('#'):
+            name, value = line.rsplit(' ', 1)
+            samples[name] = float(value)
+    return samples
+
+
+def loop_lag(before: Dict[str, float], after: Dict[str, float]) -> dict:
+    """mean and p99 (bucket bound) of the event loop lag measured between two scrapes"""
+    name = 'subbot_event_loop_lag_seconds'
+    count = after.get(f'{name}_count', 0) - before.get(f'{name}_count', 0)
+    if not count:
+        return {}
+
+    buckets = sorted((float(key.split('le="')[1].rstrip('"}').replace('+Inf', 'inf')), value - before.get(key, 0))
+                     for key, value in after.items() if key.startswith(f'{name}_bucket'))
+    p99 = next(bound for bound, cumulative in buckets if cumulative >= 0.99 * count)
+
+    return {'samples': int(count),
+            'mean_ms': (after[f'{name}_sum'] - before.get(f'{name}_sum', 0)) / count * 1000,
+            'p99_bucket_ms': p99 * 1000,
+            'last_ms': after.get('subbot_event_loop_lag_last_seconds', 0) * 1000}
+
+
+def startup(scrapes: List[Dict[str, float]]) -> dict:
+    """READY time (of the slowest process) and cached objects (of all processes) from the metrics endpoints"""
+    name = 'subbot_startup_milestone_seconds{milestone="ready"}'
+    ready = [samples[name] for samples in scrapes if name in samples]
+
+    return {'ready_seconds': max(ready) if ready else None,
+            'cached_users': sum(samples.get('subbot_cached_objects{kind="users"}', 0) for samples in scrapes),
+            'cached_members': sum(samples.get('subbot_cached_objects{kind="members"}', 0) for samples in scrapes)}
+
+
+def git_revision() -> Optional[str]:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BOT_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run(arguments: argparse.Namespace) -> dict:
+    discord = FakeDiscord(arguments.guilds, arguments.channels, api_latency=arguments.api_latency / 1000,
+                          shard_count=arguments.shards, member_count=arguments.members)
+    controller = FakeController()
+    await discord.start()
+    await controller.start()
+    processes = arguments.shard_processes if arguments.shard_mode == 'processes' else 1
+    metrics_port = free_ports(processes)
+
+    with tempfile.TemporaryDirectory() as directory:
+        bot_dir = working_directory(directory)
+        env = dict(os.environ,
+                   DISCORD_TOKEN='benchmark', DISCORD_API_BASE=discord.api_base,
+                   IPC_HOST='127.0.0.1', IPC_PORT=str(controller.port),
+                   METRICS_HOST='127.0.0.1', METRICS_PORT=str(metrics_port), LOOP_LAG_INTERVAL='0.1',
+                   DATABASE_PATH=os.path.join(directory, 'subbot.db'),
+                   SEND_RATE_LIMIT=str(arguments.send_rate), SEND_RATE_PERIOD='1',
+                   IPC_MAX_PENDING=str(max(1024, arguments.window * 2)),
+                   SHARD_MODE=arguments.shard_mode, SHARD_COUNT=str(arguments.shards),
+                   SHARD_PROCESSES=str(arguments.shard_processes), SHARD_START_DELAY='0',
+                   RUNTIME_MODE=arguments.runtime_mode, INTENTS_PROFILE=arguments.intents_profile,
+                   EMBED_COLOR='11027200', ERROR_EMBED_COLOR='10038562')
+
+        with open(os.path.join(directory, 'subbot.out'), 'wb') as output:
+            process = await asyncio.create_subprocess_exec(sys.executable, 'discord_subbot.py', cwd=bot_dir,
+                                                           env=env, stdout=output, stderr=output)
+            started = time.perf_counter()
+
+            # wait until the guilds of all shards are registered, or for the subbot to die while starting
+            guild_ids = [int(guild_id) for guild_id in discord.guilds]
+            connecting = asyncio.ensure_future(controller.wait_registered(guild_ids))
+            exiting = asyncio.ensure_future(process.wait())
+            await asyncio.wait((connecting, exiting), timeout=arguments.startup_timeout,
+                               return_when=asyncio.FIRST_COMPLETED)
+            if not connecting.done():
+                connecting.cancel()
+                if process.returncode is None:
+                    process.kill()
+                await exiting
+                with open(os.path.join(directory, 'subbot.out'), 'rb') as file:
+                    sys.stderr.write(file.read().decode('utf-8', 'replace')[-4000:])
+                raise SystemExit('the subbot did not register the guilds of all shards with the fake controller')
+
+            connected_after = time.perf_counter() - started
+            channel_ids = [int(channel_id) for channel_id in discord.channel_ids]
+            routes = {int(channel_id): int(guild_id) for channel_id, guild_id in discord.channel_guilds.items()}
+            text = 'x' * arguments.message_size
+
+            async with aiohttp.ClientSession() as session:
+                metrics_urls = [f'http://127.0.0.1:{metrics_port + index}/metrics' for index in range(processes)]
+                started_up = startup([await scrape(session, url) for url in metrics_urls])
+                ready_memory = read_memory(process.pid)
+
+                # warm up caches and connections, then measure
+                if arguments.warmup:
+                    await controller.run(channel_ids, arguments.warmup, arguments.window, text, routes)
+                messages_before = discord.messages_sent
+                before = [await scrape(session, url) for url in metrics_urls]
+
+                rss_samples = []
+
+                async def sample_memory():
+                    while True:
+                        rss_samples.append(read_memory(process.pid).get('VmRSS', 0))
+                        await asyncio.sleep(0.25)
+
+                sampler = asyncio.ensure_future(sample_memory())
+                elapsed = await controller.run(channel_ids, arguments.requests, arguments.window, text, routes)
+                sampler.cancel()
+
+                after = [await scrape(session, url) for url in metrics_urls]
+                memory = read_memory(process.pid)
+
+            # SHUTDOWN drains the subbot, it exits once everything is flushed
+            shutdown_started = time.perf_counter()
+            await controller.shutdown()
+            try:
+                await asyncio.wait_for(process.wait(), 30)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+            shutdown_seconds = time.perf_counter() - shutdown_started
+
+    await controller.close()
+    await discord.close()
+
+    latencies = controller.latencies
+    messages = discord.messages_sent - messages_before
+    return {
+        'time': datetime.datetime.now().isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'config': vars(arguments),
+        'startup_seconds': connected_after,
+        'startup': dict(started_up, rss_kb=ready_memory.get('VmRSS')),
+        'shutdown_seconds': shutdown_seconds,
+        'duration_seconds': elapsed,
+        'commands': dict(controller.counts),
+        'commands_per_second': arguments.requests / elapsed,
+        'messages_sent': messages,
+        'messages_per_second': messages / elapsed,
+        'latency_ms': {'p50': percentile(latencies, 0.5) * 1000 if latencies else None,
+                       'p99': percentile(latencies, 0.99) * 1000 if latencies else None,
+                       'max': max(latencies) * 1000 if latencies else None},
+        'rss_kb': {'end': memory.get('VmRSS'), 'peak': memory.get('VmHWM'),
+                   'max_sampled': max(rss_samples) if rss_samples else None},
+        # one entry per subbot process
+        'event_loop_lag': [loop_lag(*scrapes) for scrapes in zip(before, after)],
+    }
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description='end-to-end benchmark of the subbot against local fakes')
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--requests', type=int, default=20000, help='REPEAT commands to measure')
+    parser.add_argument('--warmup', type=int, default=1000, help='REPEAT commands before measuring')
+    parser.add_argument('--window', type=int, default=256, help='commands in flight at most')
+    parser.add_argument('--message-size', type=int, default=32, help='characters per repeated message')
+    parser.add_argument('--api-latency', type=float, default=0.0, help='ms the fake API waits before answering')
+    parser.add_argument('--send-rate', type=int, default=1000000, help='SEND_RATE_LIMIT per second and channel')
+    parser.add_argument('--shard-mode', choices=('single', 'auto', 'processes'), default='single')
+    parser.add_argument('--shards', type=int, default=1, help='SHARD_COUNT, shards the fake gateway recommends')
+    parser.add_argument('--shard-processes', type=int, default=1, help='SHARD_PROCESSES with --shard-mode processes')
+    parser.add_argument('--runtime-mode', choices=('default', 'fast'), default='default',
+                        help='RUNTIME_MODE, fast uses uvloop and orjson if installed')
+    parser.add_argument('--intents-profile', choices=('lean', 'all'), default='lean', help='INTENTS_PROFILE')
+    parser.add_argument('--members', type=int, default=0, help='members of every fake guild besides the bot')
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--output', default='bench_e2e.json', help='json file the results are written to')
+    return parser
+
+
+def main():
+    arguments = build_parser().parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(arguments))
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    latency = results['latency_ms']
+    print(f'{arguments.requests} commands over {arguments.channels} channels in {results["duration_seconds"]:.2f}s: '
+          f'{results["commands_per_second"]:.0f} commands/s, {results["messages_per_second"]:.0f} messages/s')
+    print(f'latency p50 {latency["p50"]:.2f}ms, p99 {latency["p99"]:.2f}ms, max {latency["max"]:.2f}ms')
+    print(f'rss {results["rss_kb"]["end"]} kB (peak {results["rss_kb"]["peak"]} kB), '
+          f'event loop lag {results["event_loop_lag"]}')
+    started_up = results['startup']
+    print(f'startup {results["startup_seconds"]:.2f}s (READY after {started_up["ready_seconds"] or 0:.2f}s, '
+          f'rss {started_up["rss_kb"]} kB, {started_up["cached_members"]:.0f} members cached), '
+          f'shutdown {results["shutdown_seconds"]:.2f}s')
+    print(f'results written to {arguments.output}')
+
+
+if __name__ == '__main__':
+    main()
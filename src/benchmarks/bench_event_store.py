@@ -0,0 +1,65 @@
+# imports
+import os
+import sys
+import time
+import sqlite3
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'discord_bot'))
+from event_store import EventStore, SCHEMA, INSERT_COMMAND  # noqa: E402
+
+
+# benchmark
+"""
+sustained write rate of the command audit: one autocommitted insert per event on the calling thread
+versus the event store (queue + writer thread, batched transactions in WAL mode);
+run with: python bench_event_store.py [event_count]
+"""
+
+
+def per_event(path: str, count: int) -> float:
+    """one connection, one transaction per insert; returns seconds spent on this thread"""
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+
+    start = time.perf_counter()
+    for request_id in range(count):
+        connection.execute(INSERT_COMMAND, (time.time(), request_id, 16, request_id % 50, 'ok', request_id, None))
+        connection.commit()
+    elapsed = time.perf_counter() - start
+
+    connection.close()
+    return elapsed
+
+
+def batched(path: str, count: int):
+    """returns seconds spent recording on this thread and seconds until everything was written"""
+    store = EventStore(path)
+    store.start()
+
+    start = time.perf_counter()
+    for request_id in range(count):
+        store.record_command(request_id, 16, request_id % 50, 'ok', request_id)
+        store.count_message(request_id % 50)
+    recorded = time.perf_counter() - start
+
+    store.close()
+    return recorded, time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 20_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        elapsed = per_event(os.path.join(directory, 'per_event.db'), count)
+        print(f'{"insert + commit per event":>26}: {count / elapsed:10.0f} events/s, '
+              f'{elapsed / count * 1e6:8.2f} us per event on the calling thread')
+
+        # every command comes with a message counter update, so twice the events
+        recorded, written = batched(os.path.join(directory, 'batched.db'), count)
+        print(f'{"event store":>26}: {count * 2 / written:10.0f} events/s, '
+              f'{recorded / count / 2 * 1e6:8.2f} us per event on the calling thread')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+# imports
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from typing import List, Tuple
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'discord_bot'))
+import runtime_mode  # noqa: E402
+
+
+# benchmark
+"""
+gateway events decoded per second and CPU time per event for every RUNTIME_MODE (see runtime_mode.py), measured
+on a recorded gateway session: READY and GUILD_CREATE (guilds with members and presences, as with Intents.all())
+set up the cache, then the events are replayed. two numbers per mode:
+    decode      json.loads of the gateway module (the stdlib json or the orjson shim)
+    dispatch    DiscordWebSocket.received_message, i.e. decoding plus discord.py's parsers updating the cache
+every mode runs in a fresh interpreter, the event loop policy and the patched modules are process wide.
+the recording is one gateway frame (json text, as sent with compression disabled) per line; without --payloads a
+synthetic session is generated. a real one can be captured by writing json.dumps(payload) of every
+on_socket_response event of a running bot. zlib decompression costs the same in every mode and is left out
+run with: python bench_gateway_decode.py [--events 50000] [--repeat 3] [--payloads session.jsonl]
+                                         [--output bench_gateway_decode.json]
+"""
+SNOWFLAKE_BASE = 100000000000000000
+SETUP_EVENTS = ('READY', 'GUILD_CREATE')
+TIMESTAMP = '2021-01-01T00:00:00.000000+00:00'
+
+
+# synthetic session
+def user(number: int) -> dict:
+    return {'id': str(SNOWFLAKE_BASE + 10 ** 6 + number), 'username': f'user {number} ✨', 'discriminator': '0001',
+            'avatar': 'a' * 32, 'bot': False, 'public_flags': 0}
+
+
+def member(number: int, nick: str = None) -> dict:
+    return {'user': user(number), 'roles': [], 'nick': nick, 'joined_at': TIMESTAMP, 'deaf': False, 'mute': False}
+
+
+def session(guild_count: int, members_per_guild: int, channels_per_guild: int, event_count: int,
+            seed: int = 0) -> List[str]:
+    """READY, a GUILD_CREATE per guild and event_count events of the kinds a busy guild sends most"""
+    rng = random.Random(seed)
+    frames = []
+
+    def frame(event: str, data: dict) -> None:
+        frames.append(json.dumps({'op': 0, 't': event, 's': len(frames) + 1, 'd': data}, ensure_ascii=False))
+
+    guild_ids = [str(SNOWFLAKE_BASE + (number << 22)) for number in range(guild_count)]
+    channels = {guild_id: [str(int(guild_id) + 1 + number) for number in range(channels_per_guild)]
+                for guild_id in guild_ids}
+
+    frame('READY', {'v': 6, 'user': dict(user(0), bot=True, verified=True, mfa_enabled=False, flags=0),
+                    'session_id': 'benchmark', 'private_channels': [], 'relationships': [],
+                    'guilds': [{'id': guild_id, 'unavailable': True} for guild_id in guild_ids]})
+
+    for guild_id in guild_ids:
+        frame('GUILD_CREATE', {
+            'id': guild_id, 'name': f'guild {guild_id[-4:]}', 'icon': None, 'splash': None, 'owner_id': user(1)['id'],
+            'region': 'europe', 'afk_channel_id': None, 'afk_timeout': 300, 'verification_level': 0,
+            'default_message_notifications': 0, 'explicit_content_filter': 0,
+            'roles': [{'id': guild_id, 'name': '@everyone', 'permissions': '104324673', 'position': 0, 'color': 0,
+                       'hoist': False, 'managed': False, 'mentionable': False}],
+            'emojis': [], 'features': [], 'mfa_level': 0, 'system_channel_id': None, 'large': True,
+            'unavailable': False, 'member_count': members_per_guild, 'voice_states': [], 'threads': [],
+            'members': [member(number) for number in range(members_per_guild)],
+            'presences': [{'user': {'id': user(number)['id']}, 'status': 'online',
+                           'client_status': {'desktop': 'online'}, 'activities': []}
+                          for number in range(0, members_per_guild, 3)],
+            'channels': [{'id': channel_id, 'type': 0, 'name': f'channel-{position}', 'position': position,
+                          'permission_overwrites': [], 'nsfw': False, 'parent_id': None, 'topic': 'a topic',
+                          'last_message_id': None, 'rate_limit_per_user': 0}
+                         for position, channel_id in enumerate(channels[guild_id])],
+            'premium_tier': 0, 'preferred_locale': 'en-US'})
+
+    kinds = ('MESSAGE_CREATE', 'PRESENCE_UPDATE', 'TYPING_START', 'MESSAGE_REACTION_ADD', 'GUILD_MEMBER_UPDATE')
+    weights = (40, 25, 20, 10, 5)
+    for number in range(event_count):
+        kind = rng.choices(kinds, weights)[0]
+        guild_id = rng.choice(guild_ids)
+        channel_id = rng.choice(channels[guild_id])
+        author = rng.randrange(members_per_guild)
+        message_id = str(SNOWFLAKE_BASE + 10 ** 9 + number)
+
+        if kind == 'MESSAGE_CREATE':
+            frame(kind, {'id': message_id, 'channel_id': channel_id, 'guild_id': guild_id, 'author': user(author),
+                         'member': {key: value for key, value in member(author).items() if key != 'user'},
+                         'content': 'hello there, this is a message 👋 ' * rng.randint(1, 6), 'timestamp': TIMESTAMP,
+                         'edited_timestamp': None, 'tts': False, 'mention_everyone': False, 'mentions': [],
+                         'mention_roles': [], 'attachments': [], 'embeds': [], 'pinned': False, 'type': 0,
+                         'flags': 0})
+        elif kind == 'PRESENCE_UPDATE':
+            frame(kind, {'user': {'id': user(author)['id']}, 'guild_id': guild_id,
+                         'status': rng.choice(('online', 'idle', 'dnd')),
+                         'client_status': {'desktop': 'online', 'mobile': 'idle'},
+                         'activities': [{'name': 'a game', 'type': 0, 'created_at': 1609459200000,
+                                         'timestamps': {'start': 1609459200000}}]})
+        elif kind == 'TYPING_START':
+            frame(kind, {'channel_id': channel_id, 'guild_id': guild_id, 'user_id': user(author)['id'],
+                         'timestamp': 1609459200, 'member': member(author)})
+        elif kind == 'MESSAGE_REACTION_ADD':
+            frame(kind, {'user_id': user(author)['id'], 'channel_id': channel_id, 'message_id': message_id,
+                         'guild_id': guild_id, 'emoji': {'id': None, 'name': '👍'}, 'member': member(author)})
+        else:
+            frame(kind, dict(member(author, nick=f'nick {number}'), guild_id=guild_id))
+
+    return frames
+
+
+def split(frames: List[str]) -> Tuple[List[str], List[str]]:
+    """frames building the cache and the events to measure"""
+    setup, events = [], []
+    for frame in frames:
+        (setup if json.loads(frame).get('t') in SETUP_EVENTS else events).append(frame)
+    return setup, events
+
+
+# measuring, in the child process
+async def measure(mode: str, frames: List[str], repeat: int, runtime: dict) -> dict:
+    import discord
+    from discord.gateway import DiscordWebSocket
+
+    client = discord.Client(intents=discord.Intents.all(), chunk_guilds_at_startup=False, max_messages=1000)
+    state = client._connection
+
+    # the attributes DiscordWebSocket.from_client sets, without a socket
+    ws = DiscordWebSocket(None, loop=asyncio.get_event_loop())
+    ws._connection = state
+    ws._discord_parsers = state.parsers
+    ws._dispatch = client.dispatch
+    ws.call_hooks = state.call_hooks
+    ws.shard_id = None
+    ws.shard_count = None
+
+    setup, events = split(frames)
+    for frame in setup:
+        await ws.received_message(frame)
+
+    loads = discord.gateway.json.loads
+    results = {'mode': mode, **runtime, 'events': len(events) * repeat}
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        for frame in events:
+            loads(frame)
+    results['decode'] = rates(len(events) * repeat, time.perf_counter() - wall, time.process_time() - cpu)
+
+    wall, cpu = time.perf_counter(), time.process_time()
+    for _ in range(repeat):
+        for frame in events:
+            await ws.received_message(frame)
+    results['dispatch'] = rates(len(events) * repeat, time.perf_counter() - wall, time.process_time() - cpu)
+
+    if state._ready_task is not None:
+        state._ready_task.cancel()
+    return results
+
+
+def rates(events: int, wall: float, cpu: float) -> dict:
+    return {'events_per_second': events / wall, 'cpu_us_per_event': cpu / events * 1e6}
+
+
+def child(arguments: argparse.Namespace) -> None:
+    runtime = runtime_mode.install(arguments.child)
+    with open(arguments.payloads, encoding='utf-8') as file:
+        frames = [line.rstrip('\n') for line in file if line.strip()]
+
+    loop = asyncio.get_event_loop()
+    results = loop.run_until_complete(measure(arguments.child, frames, arguments.repeat, runtime))
+    print(json.dumps(results))
+
+
+# comparing, in the parent process
+def main():
+    parser = argparse.ArgumentParser(description='gateway decoding per runtime mode on a recorded session')
+    parser.add_argument('--payloads', help='recorded session, one gateway frame per line (default: synthetic)')
+    parser.add_argument('--guilds', type=int, default=10)
+    parser.add_argument('--members', type=int, default=1000, help='members per synthetic guild')
+    parser.add_argument('--channels', type=int, default=20, help='channels per synthetic guild')
+    parser.add_argument('--events', type=int, default=50000, help='events of the synthetic session')
+    parser.add_argument('--repeat', type=int, default=3, help='replays of the events per mode')
+    parser.add_argument('--modes', default=','.join(runtime_mode.MODES))
+    parser.add_argument('--output', default='bench_gateway_decode.json', help='json file the results are written to')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+
+    if arguments.child:
+        return child(arguments)
+
+    with tempfile.TemporaryDirectory() as directory:
+        payloads = arguments.payloads
+        if payloads is None:
+            payloads = os.path.join(directory, 'session.jsonl')
+            with open(payloads, 'w', encoding='utf-8') as file:
+                for frame in session(arguments.guilds, arguments.members, arguments.channels, arguments.events):
+                    file.write(f'{frame}\n')
+
+        results = []
+        for mode in arguments.modes.split(','):
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', mode,
+                                     '--payloads', payloads, '--repeat', str(arguments.repeat)],
+                                    capture_output=True, text=True, check=True).stdout
+            results.append(json.loads(output.strip().splitlines()[-1]))
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    for result in results:
+        decode, dispatch = result['decode'], result['dispatch']
+        print(f'{result["mode"]:8} ({result["event_loop"]}, {result["json"]}): '
+              f'decode {decode["events_per_second"]:,.0f} events/s, {decode["cpu_us_per_event"]:.2f}us cpu/event; '
+              f'dispatch {dispatch["events_per_second"]:,.0f} events/s, {dispatch["cpu_us_per_event"]:.2f}us cpu/event')
+    print(f'results written to {arguments.output}')
+
+
+if __name__ == '__main__':
+    main()
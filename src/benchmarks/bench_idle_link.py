@@ -0,0 +1,141 @@
+# imports
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+from typing import List
+
+import aiohttp
+
+import bench_e2e
+from fake_discord import FakeDiscord
+from fake_controller import FakeController
+
+
+# benchmark
+"""
+the discord session has to stay alive while the link to the main bot is idle: reading the link used to block the
+event loop, so the gateway heartbeat stopped until the next command arrived. the subbot runs against the fake
+gateway (short heartbeat interval) and a fake controller that connects and then sends nothing but PONGs.
+reported over the idle window: gateway heartbeats and the largest gap between them, IPC keepalive PINGs, and the
+event loop lag from the metrics endpoint.
+--check exits with 1 if a heartbeat came more than 1.5 intervals late or the subbot stopped pinging the controller
+run with: python bench_idle_link.py [--idle 10] [--heartbeat-interval 0.5] [--check]
+"""
+
+
+def gaps(times: List[float], start: float, end: float) -> List[float]:
+    """seconds between the events within the window, including from its start to the first event"""
+    times = [start] + [moment for moment in times if start <= moment <= end] + [end]
+    return [later - earlier for earlier, later in zip(times, times[1:])]
+
+
+async def run(arguments: argparse.Namespace) -> dict:
+    discord = FakeDiscord(1, 1, heartbeat_interval=arguments.heartbeat_interval)
+    controller = FakeController()
+    await discord.start()
+    await controller.start()
+    metrics_port = bench_e2e.free_ports()
+
+    with tempfile.TemporaryDirectory() as directory:
+        bot_dir = bench_e2e.working_directory(directory)
+        env = dict(os.environ,
+                   DISCORD_TOKEN='benchmark', DISCORD_API_BASE=discord.api_base,
+                   IPC_HOST='127.0.0.1', IPC_PORT=str(controller.port),
+                   IPC_HEARTBEAT_INTERVAL=str(arguments.ipc_heartbeat_interval),
+                   METRICS_HOST='127.0.0.1', METRICS_PORT=str(metrics_port), LOOP_LAG_INTERVAL='0.1',
+                   DATABASE_PATH=os.path.join(directory, 'subbot.db'),
+                   EMBED_COLOR='11027200', ERROR_EMBED_COLOR='10038562')
+
+        with open(os.path.join(directory, 'subbot.out'), 'wb') as output:
+            process = await asyncio.create_subprocess_exec(sys.executable, 'discord_subbot.py', cwd=bot_dir,
+                                                           env=env, stdout=output, stderr=output)
+            try:
+                await asyncio.wait_for(controller.wait_registered([int(guild_id) for guild_id in discord.guilds]),
+                                       arguments.startup_timeout)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+                raise SystemExit('the subbot did not connect to the fake controller')
+
+            async with aiohttp.ClientSession() as session:
+                url = f'http://127.0.0.1:{metrics_port}/metrics'
+                before = await bench_e2e.scrape(session, url)
+
+                # the link is connected and idle from here on
+                start, pings = time.monotonic(), len(controller.pings)
+                await asyncio.sleep(arguments.idle)
+                end, pings = time.monotonic(), len(controller.pings) - pings
+
+                after = await bench_e2e.scrape(session, url)
+
+            await controller.shutdown()
+            try:
+                await asyncio.wait_for(process.wait(), 30)
+            except asyncio.TimeoutError:
+                process.kill()
+                await process.wait()
+
+    await controller.close()
+    await discord.close()
+
+    heartbeat_gaps = gaps(discord.heartbeats, start, end)
+
+    return {
+        'config': vars(arguments),
+        'idle_seconds': end - start,
+        'gateway_heartbeats': len(heartbeat_gaps) - 1,
+        'gateway_heartbeats_expected': int((end - start) / arguments.heartbeat_interval),
+        'max_heartbeat_gap_seconds': max(heartbeat_gaps),
+        'ipc_pings': pings,
+        'ipc_pings_expected': int((end - start) / arguments.ipc_heartbeat_interval),
+        'event_loop_lag': bench_e2e.loop_lag(before, after),
+    }
+
+
+def check(results: dict, arguments: argparse.Namespace) -> List[str]:
+    problems = []
+    if results['max_heartbeat_gap_seconds'] > 1.5 * arguments.heartbeat_interval:
+        problems.append(f'a gateway heartbeat came {results["max_heartbeat_gap_seconds"]:.2f}s after the one before, '
+                        f'the interval is {arguments.heartbeat_interval}s')
+    if results['ipc_pings'] < results['ipc_pings_expected'] - 1:
+        problems.append(f'{results["ipc_pings"]} IPC pings, {results["ipc_pings_expected"]} expected')
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='gateway heartbeats of the subbot while the main bot link is idle')
+    parser.add_argument('--idle', type=float, default=10.0, help='seconds the link stays idle')
+    parser.add_argument('--heartbeat-interval', type=float, default=0.5, help='gateway heartbeat interval in seconds')
+    parser.add_argument('--ipc-heartbeat-interval', type=float, default=1.0, help='IPC_HEARTBEAT_INTERVAL')
+    parser.add_argument('--startup-timeout', type=float, default=60.0)
+    parser.add_argument('--check', action='store_true', help='exit with 1 if the heartbeat stalled')
+    parser.add_argument('--output', default='bench_idle_link.json', help='json file the results are written to')
+    arguments = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(arguments))
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    print(f'{results["idle_seconds"]:.1f}s idle: {results["gateway_heartbeats"]} gateway heartbeats '
+          f'({results["gateway_heartbeats_expected"]} expected, '
+          f'largest gap {results["max_heartbeat_gap_seconds"]:.2f}s), '
+          f'{results["ipc_pings"]} IPC pings ({results["ipc_pings_expected"]} expected)')
+    print(f'event loop lag {results["event_loop_lag"]}')
+    print(f'results written to {arguments.output}')
+
+    if arguments.check:
+        problems = check(results, arguments)
+        for problem in problems:
+            print(f'check failed: {problem}')
+        if problems:
+            raise SystemExit(1)
+        print('check passed: the gateway heartbeat kept its interval while the link was idle')
+
+
+if __name__ == '__main__':
+    main()
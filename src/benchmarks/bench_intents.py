@@ -0,0 +1,64 @@
+# imports
+import json
+import asyncio
+import argparse
+
+import bench_e2e
+
+
+# benchmark
+"""
+the end-to-end benchmark (bench_e2e.py) once per INTENTS_PROFILE against fake guilds full of members and presences.
+with the lean profile the gateway leaves them out; with the all profile the subbot receives and caches them.
+reported per profile: seconds until READY, RSS right after startup, cached users / members and commands per second
+run with: python bench_intents.py [--profiles lean,all] [--guilds 5] [--members 5000] [--output bench_intents.json]
+"""
+
+
+async def run(arguments: argparse.Namespace) -> list:
+    results = []
+    for profile in arguments.profiles:
+        e2e_arguments = bench_e2e.build_parser().parse_args([
+            '--guilds', str(arguments.guilds), '--channels', str(arguments.channels),
+            '--members', str(arguments.members), '--intents-profile', profile,
+            '--requests', str(arguments.requests), '--warmup', '0'])
+
+        result = await bench_e2e.run(e2e_arguments)
+        result['profile'] = profile
+        results.append(result)
+
+        started_up = result['startup']
+        print(f'{profile:>4}: READY after {started_up["ready_seconds"] or 0:.2f}s, rss {started_up["rss_kb"]} kB, '
+              f'{started_up["cached_users"]:.0f} users / {started_up["cached_members"]:.0f} members cached, '
+              f'{result["commands_per_second"]:.0f} commands/s')
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='startup time and memory of the subbot per intents profile')
+    parser.add_argument('--profiles', type=lambda value: value.split(','), default=['lean', 'all'],
+                        help='comma separated INTENTS_PROFILE values to compare')
+    parser.add_argument('--guilds', type=int, default=5)
+    parser.add_argument('--channels', type=int, default=50)
+    parser.add_argument('--members', type=int, default=5000, help='members of every fake guild')
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--output', default='bench_intents.json', help='json file the results are written to')
+    arguments = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(arguments))
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    baseline = results[0]['startup']
+    for result in results[1:]:
+        started_up = result['startup']
+        print(f'{result["profile"]} vs {results[0]["profile"]}: '
+              f'{(started_up["ready_seconds"] or 0) - (baseline["ready_seconds"] or 0):+.2f}s until READY, '
+              f'{started_up["rss_kb"] - baseline["rss_kb"]:+d} kB rss')
+    print(f'results written to {arguments.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+# imports
+import os
+import sys
+import time
+import struct
+import pickle
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'discord_bot'))
+import ipc_protocol  # noqa: E402
+from ipc_protocol import Opcode  # noqa: E402
+
+
+# benchmark
+"""
+compares decoding frames/sec of the old link (multiprocessing.connection pickles + str.split)
+against ipc_protocol frames; run with: python bench_ipc_protocol.py [frame_count]
+"""
+CHANNEL_ID = 123456789012345678
+TEXT = 'hello from the main bot, this message has a few words in it'
+
+
+def build_pickle_stream(count: int) -> bytes:
+    payload = pickle.dumps(f'{CHANNEL_ID} 0 repeat {TEXT}')
+    return (struct.pack('!i', len(payload)) + payload) * count
+
+
+def decode_pickle_stream(data: bytes) -> int:
+    view = memoryview(data)
+    offset = 0
+    decoded = 0
+    while offset < len(view):
+        size, = struct.unpack_from('!i', view, offset)
+        offset += 4
+        message = pickle.loads(view[offset:offset + size])
+        offset += size
+
+        message_part_list = message.split(' ')
+        if message_part_list[2] == 'repeat':
+            int(message_part_list[0])
+            ' '.join(message_part_list[3:])
+            decoded += 1
+
+    return decoded
+
+
+def build_frame_stream(count: int) -> bytes:
+    return ipc_protocol.encode_text(Opcode.REPEAT, CHANNEL_ID, TEXT) * count
+
+
+def decode_frame_stream(data: bytes, read_size: int = 65536) -> int:
+    decoder = ipc_protocol.FrameDecoder()
+    decoded = 0
+    for index in range(0, len(data), read_size):
+        for frame in decoder.feed(data[index:index + read_size]):
+            if frame.opcode == Opcode.REPEAT:
+                ipc_protocol.decode_text(frame.payload)
+                decoded += 1
+
+    return decoded
+
+
+def measure(name: str, decode, data: bytes, count: int) -> None:
+    start = time.perf_counter()
+    decoded = decode(data)
+    elapsed = time.perf_counter() - start
+
+    assert decoded == count
+    print(f'{name:>24}: {count / elapsed:12,.0f} frames/sec ({len(data) / count:.0f} bytes/frame)')
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    measure('pickle + split', decode_pickle_stream, build_pickle_stream(count), count)
+    measure('ipc_protocol frames', decode_frame_stream, build_frame_stream(count), count)
+
+
+if __name__ == '__main__':
+    main()
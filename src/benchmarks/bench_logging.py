@@ -0,0 +1,78 @@
+# imports
+import os
+import sys
+import time
+import logging
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'discord_bot'))
+import logging_setup  # noqa: E402
+
+
+# benchmark
+"""
+time spent on the calling (event loop) thread per gateway event, for the previous logging setup
+(root at DEBUG, synchronous StreamHandler + FileHandler) and the queued pipeline with per-logger levels;
+run with: python bench_logging.py [event_count]
+"""
+FORMAT = '%(asctime)s [%(levelname)8.8s] %(filename)20.20s | %(message)s'
+
+
+def configure(directory: str, queued: bool, quiet_discord: bool) -> logging.handlers.QueueListener:
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+    root.setLevel(logging.DEBUG)
+
+    stream_handler = logging.StreamHandler(open(os.devnull, 'w'))
+    if queued:
+        file_handler = logging_setup.CompressingRotatingFileHandler(os.path.join(directory, 'queued.log'),
+                                                                    maxBytes=10485760, backupCount=10)
+    else:
+        file_handler = logging.FileHandler(os.path.join(directory, 'sync.log'))
+
+    for handler in (stream_handler, file_handler):
+        handler.setFormatter(logging.Formatter(FORMAT))
+        root.addHandler(handler)
+
+    # the new logging.conf keeps discord's gateway / http chatter at WARNING
+    level = logging.WARNING if quiet_discord else logging.NOTSET
+    logging.getLogger('discord.gateway').setLevel(level)
+    logging.getLogger('discord.http').setLevel(level)
+
+    return logging_setup.start_queue_listener() if queued else None
+
+
+def simulate(count: int) -> float:
+    """what discord.py and the subbot log per gateway event, returns seconds spent on this thread"""
+    gateway = logging.getLogger('discord.gateway')
+    subbot = logging.getLogger('subbot')
+    payload = {'t': 'MESSAGE_CREATE', 's': 1, 'op': 0, 'd': {'content': 'hello world', 'id': '1234567890'}}
+
+    start = time.perf_counter()
+    for sequence in range(count):
+        gateway.debug('For Shard ID %s: WebSocket Event: %s', None, payload)
+        if sequence % 100 == 0:
+            subbot.info(f'handled {sequence} events')
+
+    return time.perf_counter() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 50_000
+
+    with tempfile.TemporaryDirectory() as directory:
+        for name, queued, quiet_discord in (('synchronous handlers', False, False),
+                                            ('queued, gateway at DEBUG', True, False),
+                                            ('queued pipeline', True, True)):
+            listener = configure(directory, queued, quiet_discord)
+            elapsed = simulate(count)
+            print(f'{name:>26}: {elapsed / count * 1e6:8.2f} us per gateway event on the event loop thread')
+
+            if listener is not None:
+                logging_setup.stop_queue_listener(listener)
+
+
+if __name__ == '__main__':
+    main()
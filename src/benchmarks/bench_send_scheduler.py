@@ -0,0 +1,167 @@
+# imports
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+from typing import List
+
+import discord
+
+from fake_discord import FakeDiscord
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'discord_bot'))
+from send_scheduler import SendScheduler  # noqa: E402
+
+
+# benchmark
+"""
+API calls and 429s of a burst of REPEAT messages against the fake discord API enforcing a per-channel rate limit:
+    direct      every message sent right away with channel.send, as before the send scheduler
+    scheduler   through the SendScheduler, waiting for the channel's bucket instead of running into 429s
+    coalesce    through the SendScheduler with coalesce=True, as REPEAT sends them, joining queued plain text
+    gaps        through the SendScheduler in short bursts with pauses, so the channel's worker ends and starts again
+                while sends of its earlier runs are still within the rate limit window
+the messages go through discord.py's HTTPClient, which retries 429s itself, so the fake counts the 429s.
+--check exits with 1 unless the scheduler modes got no 429 and coalescing made fewer API calls than without
+run with: python bench_send_scheduler.py [--channels 4] [--messages 40] [--rate 5] [--period 1] [--check]
+"""
+MODES = ('direct', 'scheduler', 'coalesce', 'gaps')
+# periods between the starts of the burst cycles of the gaps mode
+GAPS_CYCLE = 2.2
+
+
+class Channel:
+    """the part of discord.TextChannel the send scheduler uses, sending over the HTTPClient"""
+    def __init__(self, http: discord.http.HTTPClient, channel_id: int):
+        self.http = http
+        self.id = channel_id
+
+    async def send(self, content=None, **kwargs):
+        return await self.http.send_message(self.id, content)
+
+
+async def burst(mode: str, channels: List[Channel], messages: int, rate: int, period: float) -> List:
+    """send messages messages to every channel at once, returns the results (sent messages or errors)"""
+    loop = asyncio.get_event_loop()
+    scheduler = SendScheduler(loop, rate=rate, per=period)
+
+    if mode == 'gaps':
+        return await gaps(scheduler, channels, messages, rate, period)
+
+    sends = []
+    for number in range(messages):
+        for channel in channels:
+            content = f'message {number}'
+            if mode == 'direct':
+                sends.append(channel.send(content))
+            else:
+                sends.append(scheduler.submit(channel, content, coalesce=mode == 'coalesce'))
+
+    return await asyncio.gather(*sends, return_exceptions=True)
+
+
+async def gaps(scheduler: SendScheduler, channels: List[Channel], messages: int, rate: int, period: float) -> List:
+    """send messages messages to every channel in cycles of three bursts
+
+    when the third burst starts, the window still holds the second one; a scheduler forgetting the bucket of the
+    first run too early sends the third burst at once
+    """
+    # (start in periods, messages)
+    pattern = ((0.0, 1), (0.5, max(1, rate - 1)), (1.1, rate))
+    start = time.perf_counter()
+
+    sends, number, cycle = [], 0, 0
+    while number < messages:
+        for offset, size in pattern:
+            await asyncio.sleep(max(0.0, start + (cycle * GAPS_CYCLE + offset) * period - time.perf_counter()))
+            for _ in range(min(size, messages - number)):
+                sends.extend(scheduler.submit(channel, f'message {number}') for channel in channels)
+                number += 1
+        cycle += 1
+
+    return await asyncio.gather(*sends, return_exceptions=True)
+
+
+async def run(arguments: argparse.Namespace) -> List[dict]:
+    fake = FakeDiscord(1, arguments.channels, rate_limit=(arguments.rate, arguments.period))
+    await fake.start()
+    discord.http.Route.BASE = fake.api_base
+
+    http = discord.http.HTTPClient(loop=asyncio.get_event_loop())
+    await http.static_login('benchmark', bot=True)
+    channels = [Channel(http, int(channel_id)) for channel_id in fake.channel_ids]
+
+    results = []
+    try:
+        for mode in arguments.modes:
+            # every mode starts with full buckets
+            await asyncio.sleep(arguments.period)
+            fake.buckets.clear()
+            sent, rate_limited = fake.messages_sent, fake.rate_limited
+
+            start = time.perf_counter()
+            outcomes = await burst(mode, channels, arguments.messages, arguments.rate, arguments.period)
+            elapsed = time.perf_counter() - start
+
+            results.append({'mode': mode,
+                            'messages': len(outcomes),
+                            'failed': sum(isinstance(outcome, Exception) for outcome in outcomes),
+                            'api_calls': fake.messages_sent - sent + fake.rate_limited - rate_limited,
+                            'rate_limited': fake.rate_limited - rate_limited,
+                            'seconds': elapsed})
+    finally:
+        await http.close()
+        await fake.close()
+
+    return results
+
+
+def check(results: List[dict]) -> List[str]:
+    """what the send scheduler promises and the results do not show"""
+    by_mode = {result['mode']: result for result in results}
+    problems = [f'{mode}: {by_mode[mode]["rate_limited"]} requests were rate limited'
+                for mode in ('scheduler', 'coalesce', 'gaps') if by_mode.get(mode, {}).get('rate_limited')]
+    problems += [f'{result["mode"]}: {result["failed"]} messages failed' for result in results
+                 if result['mode'] != 'direct' and result['failed']]
+
+    if 'scheduler' in by_mode and 'coalesce' in by_mode and \
+            by_mode['coalesce']['api_calls'] >= by_mode['scheduler']['api_calls']:
+        problems.append('coalescing did not save any API calls')
+
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description='API calls and 429s with and without the send scheduler')
+    parser.add_argument('--channels', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=40, help='messages per channel')
+    parser.add_argument('--rate', type=int, default=5, help='messages the fake API allows per period and channel')
+    parser.add_argument('--period', type=float, default=1.0, help='seconds of the rate limit window')
+    parser.add_argument('--modes', type=lambda value: value.split(','), default=list(MODES))
+    parser.add_argument('--check', action='store_true', help='exit with 1 if the scheduler did not hold up')
+    parser.add_argument('--output', default='bench_send_scheduler.json', help='json file the results are written to')
+    arguments = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(arguments))
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    for result in results:
+        print(f'{result["mode"]:>9}: {result["messages"]} messages, {result["api_calls"]} API calls, '
+              f'{result["rate_limited"]} rate limited, {result["failed"]} failed, {result["seconds"]:.2f}s')
+    print(f'results written to {arguments.output}')
+
+    if arguments.check:
+        problems = check(results)
+        for problem in problems:
+            print(f'check failed: {problem}')
+        if problems:
+            raise SystemExit(1)
+        print('check passed: no 429s through the send scheduler, fewer API calls with coalescing')
+
+
+if __name__ == '__main__':
+    main()
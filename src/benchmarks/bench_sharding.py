@@ -0,0 +1,66 @@
+# imports
+import json
+import asyncio
+import argparse
+
+import bench_e2e
+
+
+# benchmark
+"""
+the end-to-end benchmark (bench_e2e.py) with the subbot split over 1, 2, 4... processes (SHARD_MODE=processes,
+one shard per process), the fake controller routing each command to the process owning its channel.
+reported per run: commands per second, p50 / p99 latency and the RSS summed over all processes.
+everything shares the machine with the fakes and the harness, so the numbers only show a gain while the subbot
+is the bottleneck (one event loop saturated) and there are free cores; on small machines expect little change
+run with: python bench_sharding.py [--processes 1,2,4] [--requests 20000] [--output bench_sharding.json]
+"""
+
+
+async def run(arguments: argparse.Namespace) -> list:
+    results = []
+    for processes in arguments.processes:
+        e2e_arguments = bench_e2e.build_parser().parse_args([
+            '--guilds', str(arguments.guilds), '--channels', str(arguments.channels),
+            '--requests', str(arguments.requests), '--warmup', str(arguments.warmup),
+            '--window', str(arguments.window), '--api-latency', str(arguments.api_latency),
+            '--shard-mode', 'processes', '--shards', str(processes), '--shard-processes', str(processes)])
+
+        result = await bench_e2e.run(e2e_arguments)
+        result['processes'] = processes
+        results.append(result)
+
+        print(f'{processes} processes: {result["commands_per_second"]:.0f} commands/s, '
+              f'p50 {result["latency_ms"]["p50"]:.2f}ms, p99 {result["latency_ms"]["p99"]:.2f}ms, '
+              f'rss {result["rss_kb"]["end"]} kB')
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='end-to-end benchmark of the subbot split over several processes')
+    parser.add_argument('--processes', type=lambda value: [int(number) for number in value.split(',')],
+                        default=[1, 2, 4], help='comma separated numbers of processes to compare')
+    parser.add_argument('--guilds', type=int, default=8)
+    parser.add_argument('--channels', type=int, default=64)
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--warmup', type=int, default=1000)
+    parser.add_argument('--window', type=int, default=256)
+    parser.add_argument('--api-latency', type=float, default=0.0, help='ms the fake API waits before answering')
+    parser.add_argument('--output', default='bench_sharding.json', help='json file the results are written to')
+    arguments = parser.parse_args()
+
+    results = asyncio.get_event_loop().run_until_complete(run(arguments))
+
+    with open(arguments.output, 'w') as file:
+        json.dump(results, file, indent=2)
+
+    baseline = results[0]['commands_per_second']
+    for result in results:
+        print(f'{result["processes"]} processes: {result["commands_per_second"] / baseline:.2f}x the throughput of '
+              f'{results[0]["processes"]}')
+    print(f'results written to {arguments.output}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,158 @@
+# imports
+import os
+import sys
+import time
+import asyncio
+import logging
+from typing import Dict, List, Optional
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'discord_bot'))
+import ipc_protocol  # noqa: E402
+from ipc_protocol import Opcode  # noqa: E402
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# fake controller
+"""
+scripted stand-in for the main bot: accepts the subbot's IPC connections, answers AUTH and pings, and pushes
+REPEAT commands with at most `window` of them unanswered at a time. the latency of a command is the time from
+writing its frame until its RESULT (or NACK) arrives, which is after discord acknowledged the message.
+with sharded subbots every process connects on its own; commands go to the connection that registered the
+guild of the target channel (SHARD_REGISTER)
+"""
+
+
+class FakeController:
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.server = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.writers: List[asyncio.StreamWriter] = []
+        self.connected = asyncio.Event()
+        # guild id: connection of the subbot process running its shard
+        self.guild_writers: Dict[int, asyncio.StreamWriter] = {}
+
+        self.next_request_id = 1
+        # request id: time the command was written
+        self.sent: Dict[int, float] = {}
+        self.window: Optional[asyncio.Semaphore] = None
+        self.done = asyncio.Event()
+        self.expected = 0
+
+        # results
+        self.latencies: List[float] = []
+        # (finished, cancelled) of every STATUS after SHUTDOWN
+        self.statuses: List[tuple] = []
+        self.counts = {'ack': 0, 'result': 0, 'nack': 0, 'busy': 0, 'wrong_shard': 0}
+        # times the subbot's keepalive PINGs arrived
+        self.pings: List[float] = []
+
+    async def start(self) -> None:
+        self.server = await asyncio.start_server(self.accept, self.host, self.port)
+        self.port = self.server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        for writer in self.writers:
+            writer.close()
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+
+    async def accept(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        decoder = ipc_protocol.FrameDecoder()
+
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                logger.warning('subbot closed the connection')
+                if writer in self.writers:
+                    self.writers.remove(writer)
+                if not self.writers:
+                    self.connected.clear()
+                return
+
+            for frame in decoder.feed(data):
+                self.handle(frame, writer)
+
+    def handle(self, frame: ipc_protocol.Frame, writer: asyncio.StreamWriter) -> None:
+        now = time.perf_counter()
+
+        if frame.opcode == Opcode.AUTH:
+            writer.write(ipc_protocol.encode_frame(Opcode.AUTH_OK))
+            self.writers.append(writer)
+            self.writer = self.writers[0]
+            self.connected.set()
+        elif frame.opcode == Opcode.SHARD_REGISTER:
+            shard_count, guild_ids = ipc_protocol.decode_shards(frame.payload)
+            for guild_id in guild_ids:
+                self.guild_writers[guild_id] = writer
+        elif frame.opcode == Opcode.STATUS:
+            self.statuses.append(ipc_protocol.decode_status(frame.payload))
+        elif frame.opcode == Opcode.PING:
+            self.pings.append(now)
+            writer.write(ipc_protocol.encode_frame(Opcode.PONG, request_id=frame.request_id))
+        elif frame.opcode == Opcode.ACK:
+            self.counts['ack'] += 1
+        elif frame.opcode in (Opcode.RESULT, Opcode.NACK, Opcode.BUSY, Opcode.WRONG_SHARD):
+            self.counts[Opcode(frame.opcode).name.lower()] += 1
+
+            sent = self.sent.pop(frame.request_id, None)
+            if sent is not None:
+                if frame.opcode in (Opcode.RESULT, Opcode.NACK):
+                    self.latencies.append(now - sent)
+                self.window.release()
+
+            if self.expected and sum(self.counts[key] for key in ('result', 'nack', 'busy', 'wrong_shard')) >= \
+                    self.expected:
+                self.done.set()
+
+    async def wait_registered(self, guild_ids: List[int]) -> None:
+        """wait until the subbot processes registered all guilds"""
+        while not set(guild_ids) <= self.guild_writers.keys():
+            await asyncio.sleep(0.05)
+
+    async def run(self, channel_ids: List[int], count: int, window: int, text: str,
+                  routes: Dict[int, int] = None) -> float:
+        """push count REPEAT commands round robin over the channels, returns seconds until all were answered
+
+        routes maps channel ids to guild ids, commands go to the connection that registered the guild
+
+        latencies and counts start over with every run
+        """
+        self.window = asyncio.Semaphore(window)
+        self.expected = count
+        self.latencies = []
+        self.counts = dict.fromkeys(self.counts, 0)
+        self.done.clear()
+        payload = text.encode('utf-8')
+
+        start = time.perf_counter()
+        for number in range(count):
+            await self.window.acquire()
+
+            request_id = self.next_request_id
+            self.next_request_id += 1
+            channel_id = channel_ids[number % len(channel_ids)]
+            writer = self.guild_writers.get(routes[channel_id], self.writer) if routes else self.writer
+
+            self.sent[request_id] = time.perf_counter()
+            writer.write(ipc_protocol.encode_frame(Opcode.REPEAT, channel_id, payload, request_id))
+            # let the sockets drain now and then, the window bounds what is in flight anyway
+            if number % 64 == 0:
+                for writer in self.writers:
+                    await writer.drain()
+
+        for writer in self.writers:
+            await writer.drain()
+        await self.done.wait()
+        return time.perf_counter() - start
+
+    async def shutdown(self) -> None:
+        for writer in list(self.writers):
+            writer.write(ipc_protocol.encode_frame(Opcode.SHUTDOWN))
+            await writer.drain()
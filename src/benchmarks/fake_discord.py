@@ -0,0 +1,260 @@
+# imports
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+from aiohttp import web, WSMsgType
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# fake discord
+"""
+local stand-in for the parts of the discord API the subbot uses: login, gateway (HELLO, READY with unavailable
+guilds, one GUILD_CREATE per guild, heartbeat ACKs) and the REST routes for sending messages and resolving
+channels / users. every sent message is answered right away (or after api_latency seconds) and counted.
+sharded IDENTIFYs only get the guilds of their shard, guild ids are spread so that (id >> 22) % count varies.
+with rate_limit=(count, seconds) sending more than count messages per seconds to a channel is answered with a 429
+(Retry-After, no X-RateLimit-* headers, so clients cannot see the limit coming).
+every guild has member_count members (the same users in every guild), a third of them online. as with discord,
+GUILD_CREATE only lists them with the members intent and their presences with the presences intent
+"""
+INTENT_MEMBERS = 1 << 1
+INTENT_PRESENCES = 1 << 8
+API_PATH = '/api/v7'
+SNOWFLAKE_BASE = 100000000000000000
+BOT_USER = {'id': str(SNOWFLAKE_BASE + 1), 'username': 'subbot', 'discriminator': '0001', 'avatar': None,
+            'bot': True, 'verified': True, 'mfa_enabled': False, 'flags': 0}
+
+
+def snowflake(number: int) -> str:
+    return str(SNOWFLAKE_BASE + number)
+
+
+class FakeDiscord:
+    def __init__(self, guild_count: int, channel_count: int, api_latency: float = 0.0, shard_count: int = 1,
+                 rate_limit: Optional[Tuple[int, float]] = None, heartbeat_interval: float = 41.25,
+                 member_count: int = 0, host: str = '127.0.0.1', port: int = 0):
+        self.host = host
+        self.port = port
+        self.api_latency = api_latency
+        # seconds, sent in HELLO
+        self.heartbeat_interval = heartbeat_interval
+        self.rate_limit = rate_limit
+        # channel id: times of the messages sent within the rate limit window
+        self.buckets: Dict[str, deque] = {}
+        # recommended by /gateway/bot
+        self.shard_count = shard_count
+
+        # guild id: channel ids, channels spread round robin over the guilds
+        self.guilds: Dict[str, List[str]] = {snowflake(number << 22): [] for number in range(guild_count)}
+        guild_ids = list(self.guilds)
+        self.channel_ids = [snowflake(100000 + number) for number in range(channel_count)]
+        self.channel_guilds = {}
+        for number, channel_id in enumerate(self.channel_ids):
+            guild_id = guild_ids[number % guild_count]
+            self.guilds[guild_id].append(channel_id)
+            self.channel_guilds[channel_id] = guild_id
+
+        # members besides the bot
+        self.member_count = member_count
+
+        self.message_number = 0
+        self.sequence = 0
+        # counters
+        self.messages_sent = 0
+        self.requests = 0
+        self.rate_limited = 0
+        # times the gateway heartbeats arrived
+        self.heartbeats: List[float] = []
+
+        self.runner = None
+
+    @property
+    def api_base(self) -> str:
+        return f'http://{self.host}:{self.port}{API_PATH}'
+
+    async def start(self) -> None:
+        app = web.Application()
+        app.router.add_get(f'{API_PATH}/gateway', self.gateway)
+        app.router.add_get(f'{API_PATH}/gateway/bot', self.gateway)
+        app.router.add_get(f'{API_PATH}/users/@me', self.me)
+        app.router.add_post(f'{API_PATH}/users/@me/channels', self.create_dm)
+        app.router.add_get(f'{API_PATH}/users/{{user_id}}', self.user)
+        app.router.add_get(f'{API_PATH}/channels/{{channel_id}}', self.channel)
+        app.router.add_post(f'{API_PATH}/channels/{{channel_id}}/messages', self.create_message)
+        app.router.add_get('/ws', self.websocket)
+
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, self.host, self.port)
+        await site.start()
+        # the port the OS picked when port was 0
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self) -> None:
+        if self.runner is not None:
+            await self.runner.cleanup()
+
+    # payloads
+    def channel_payload(self, channel_id: str, position: int = 0) -> dict:
+        return {'id': channel_id, 'type': 0, 'name': f'channel-{channel_id[-6:]}', 'position': position,
+                'guild_id': self.channel_guilds.get(channel_id), 'permission_overwrites': [], 'nsfw': False,
+                'parent_id': None, 'topic': None, 'last_message_id': None, 'rate_limit_per_user': 0}
+
+    def member_payloads(self, count: int) -> List[dict]:
+        """the bot and count other members"""
+        users = [BOT_USER] + [{'id': snowflake(10 ** 6 + number), 'username': f'user-{number}', 'discriminator': '0001',
+                               'avatar': None, 'bot': False, 'public_flags': 0}
+                              for number in range(count)]
+        return [{'user': user, 'roles': [], 'nick': None, 'joined_at': '2021-01-01T00:00:00.000000+00:00',
+                 'deaf': False, 'mute': False} for user in users]
+
+    def presence_payloads(self) -> List[dict]:
+        return [{'user': {'id': snowflake(10 ** 6 + number)}, 'status': 'online',
+                 'client_status': {'desktop': 'online'},
+                 'activities': [{'name': 'a game', 'type': 0, 'created_at': 1609459200000}]}
+                for number in range(0, self.member_count, 3)]
+
+    def guild_payload(self, guild_id: str, intents: int = 0) -> dict:
+        channels = [self.channel_payload(channel_id, position)
+                    for position, channel_id in enumerate(self.guilds[guild_id])]
+        # without the members intent only the bot itself is listed
+        members = self.member_payloads(self.member_count if intents & INTENT_MEMBERS else 0)
+        presences = self.presence_payloads() if intents & INTENT_PRESENCES else []
+        return {'id': guild_id, 'name': f'guild-{guild_id[-4:]}', 'icon': None, 'splash': None,
+                'owner_id': BOT_USER['id'], 'region': 'europe', 'afk_channel_id': None, 'afk_timeout': 300,
+                'verification_level': 0, 'default_message_notifications': 0, 'explicit_content_filter': 0,
+                'roles': [{'id': guild_id, 'name': '@everyone', 'permissions': '104324673', 'position': 0,
+                           'color': 0, 'hoist': False, 'managed': False, 'mentionable': False}],
+                'emojis': [], 'features': [], 'mfa_level': 0, 'system_channel_id': None,
+                'large': self.member_count >= 250, 'unavailable': False, 'member_count': self.member_count + 1,
+                'members': members, 'voice_states': [], 'presences': presences,
+                'channels': channels, 'threads': [], 'premium_tier': 0, 'preferred_locale': 'en-US'}
+
+    def message_payload(self, channel_id: str, content: str) -> dict:
+        self.message_number += 1
+        return {'id': snowflake(10 ** 9 + self.message_number), 'channel_id': channel_id,
+                'guild_id': self.channel_guilds.get(channel_id), 'author': BOT_USER, 'content': content,
+                'timestamp': '2021-01-01T00:00:00.000000+00:00', 'edited_timestamp': None, 'tts': False,
+                'mention_everyone': False, 'mentions': [], 'mention_roles': [], 'attachments': [], 'embeds': [],
+                'pinned': False, 'type': 0, 'flags': 0}
+
+    # rest
+    async def respond(self, payload) -> web.Response:
+        self.requests += 1
+        if self.api_latency:
+            await asyncio.sleep(self.api_latency)
+        # discord.py only decodes json if the content type is exactly application/json, without charset
+        return web.Response(body=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'})
+
+    async def gateway(self, request: web.Request) -> web.Response:
+        return await self.respond({'url': f'ws://{self.host}:{self.port}/ws', 'shards': self.shard_count,
+                                   'session_start_limit': {'total': 1000, 'remaining': 1000, 'reset_after': 0,
+                                                           'max_concurrency': 1}})
+
+    async def me(self, request: web.Request) -> web.Response:
+        return await self.respond(BOT_USER)
+
+    async def user(self, request: web.Request) -> web.Response:
+        user_id = request.match_info['user_id']
+        return await self.respond({'id': user_id, 'username': f'user-{user_id[-4:]}', 'discriminator': '0001',
+                                   'avatar': None})
+
+    async def create_dm(self, request: web.Request) -> web.Response:
+        recipient_id = (await request.json())['recipient_id']
+        recipient = {'id': str(recipient_id), 'username': 'user', 'discriminator': '0001', 'avatar': None}
+        return await self.respond({'id': str(recipient_id), 'type': 1, 'recipients': [recipient],
+                                   'last_message_id': None})
+
+    async def channel(self, request: web.Request) -> web.Response:
+        channel_id = request.match_info['channel_id']
+        if channel_id not in self.channel_guilds:
+            raise web.HTTPNotFound(text=json.dumps({'code': 10003, 'message': 'Unknown Channel'}),
+                                   content_type='application/json')
+        return await self.respond(self.channel_payload(channel_id))
+
+    def limited(self, channel_id: str) -> Optional[float]:
+        """seconds until the channel may send again if its rate limit is used up, otherwise count the message"""
+        if self.rate_limit is None:
+            return None
+
+        count, period = self.rate_limit
+        now = time.monotonic()
+        bucket = self.buckets.setdefault(channel_id, deque())
+        while bucket and bucket[0] <= now - period:
+            bucket.popleft()
+
+        if len(bucket) >= count:
+            return bucket[0] + period - now
+
+        bucket.append(now)
+        return None
+
+    async def create_message(self, request: web.Request) -> web.Response:
+        channel_id = request.match_info['channel_id']
+        data = await request.json()
+
+        retry_after = self.limited(channel_id)
+        if retry_after is not None:
+            self.rate_limited += 1
+            # discord.py 1.7 reads retry_after in milliseconds and only retries if the response came through a proxy
+            return web.Response(status=429, headers={'Content-Type': 'application/json',
+                                                     'Retry-After': f'{retry_after:.3f}', 'Via': '1.1 fake'},
+                                body=json.dumps({'message': 'You are being rate limited.',
+                                                 'retry_after': retry_after * 1000, 'global': False}).encode('utf-8'))
+
+        self.messages_sent += 1
+
+        return await self.respond(self.message_payload(channel_id, data.get('content') or ''))
+
+    # gateway
+    async def dispatch(self, ws: web.WebSocketResponse, event: str, data: dict) -> None:
+        self.sequence += 1
+        await ws.send_str(json.dumps({'op': 0, 't': event, 's': self.sequence, 'd': data}))
+
+    async def websocket(self, request: web.Request) -> web.WebSocketResponse:
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+
+        # HELLO, the heartbeat interval is in milliseconds
+        await ws.send_str(json.dumps({'op': 10, 'd': {'heartbeat_interval': int(self.heartbeat_interval * 1000)}}))
+
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                if message.type == WSMsgType.ERROR:
+                    break
+                continue
+
+            payload = json.loads(message.data)
+            op = payload.get('op')
+
+            if op == 1:
+                self.heartbeats.append(time.monotonic())
+                await ws.send_str(json.dumps({'op': 11}))
+            elif op == 2:
+                # IDENTIFY: READY lists the guilds of the shard as unavailable, they are streamed afterwards
+                shard_id, shard_count = payload['d'].get('shard') or (0, 1)
+                intents = payload['d'].get('intents', 0)
+                guild_ids = [guild_id for guild_id in self.guilds if (int(guild_id) >> 22) % shard_count == shard_id]
+
+                await self.dispatch(ws, 'READY', {
+                    'v': 6, 'user': BOT_USER, 'session_id': f'benchmark-{shard_id}', 'private_channels': [],
+                    'relationships': [], 'shard': [shard_id, shard_count],
+                    'guilds': [{'id': guild_id, 'unavailable': True} for guild_id in guild_ids]})
+                for guild_id in guild_ids:
+                    await self.dispatch(ws, 'GUILD_CREATE', self.guild_payload(guild_id, intents))
+            elif op == 8:
+                # REQUEST_GUILD_MEMBERS, everything in one chunk
+                request = payload['d']
+                await self.dispatch(ws, 'GUILD_MEMBERS_CHUNK', {
+                    'guild_id': request['guild_id'], 'members': self.member_payloads(self.member_count),
+                    'chunk_index': 0, 'chunk_count': 1, 'nonce': request.get('nonce')})
+
+        return ws
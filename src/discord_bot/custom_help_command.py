@@ -5,6 +5,7 @@ import dotenv
 import discord
 from discord.ext import commands
 import datetime
+from typing import Dict, List, Tuple
 
 
 # logging
@@ -18,8 +19,126 @@ dotenv.load_dotenv()
 embedColor = int(os.getenv('EMBED_COLOR'))
 
 
+# discord limits
+EMBED_FIELD_VALUE_LIMIT = 1024
+EMBED_FIELD_LIMIT = 25
+# leaves room for the footer, which is added when sending
+EMBED_TOTAL_LIMIT = 5900
+
+
+# cache for help embeds
+class HelpEmbedCache:
+    """built help embeds (without footer), keyed by target
+
+    keys:
+        ('bot',)
+        ('cog', cog qualified name)
+        ('group', group qualified name)
+        ('command', command qualified name, prefix)    the signature shown contains the prefix used
+
+    the help command is copied for every invocation, so the cache lives on the class and is shared.
+    the bot invalidates entries when cogs or commands are added or removed (see HelpCacheInvalidation)
+    """
+    def __init__(self):
+        self.embeds: Dict[Tuple[str, ...], List[discord.Embed]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Tuple[str, ...], build) -> List[discord.Embed]:
+        embeds = self.embeds.get(key)
+        if embeds is None:
+            self.misses += 1
+            embeds = self.embeds[key] = build()
+        else:
+            self.hits += 1
+
+        return embeds
+
+    def invalidate_command(self, command: commands.Command) -> None:
+        """forget everything showing the command: bot help, its cog, its parent groups and itself"""
+        self.embeds.pop(('bot',), None)
+        if command.cog_name is not None:
+            self.embeds.pop(('cog', command.cog_name), None)
+
+        parent = command.parent
+        while parent is not None:
+            self.embeds.pop(('group', parent.qualified_name), None)
+            parent = parent.parent
+
+        self.embeds.pop(('group', command.qualified_name), None)
+        self.forget_command(command.qualified_name)
+
+    def forget_command(self, qualified_name: str) -> None:
+        for key in [key for key in self.embeds if key[0] == 'command' and key[1] == qualified_name]:
+            del self.embeds[key]
+
+    def invalidate_cog(self, cog: commands.Cog) -> None:
+        """forget everything showing the cog or one of its commands"""
+        self.embeds.pop(('bot',), None)
+        self.embeds.pop(('cog', cog.qualified_name), None)
+
+        for command in cog.walk_commands():
+            self.embeds.pop(('group', command.qualified_name), None)
+            self.forget_command(command.qualified_name)
+
+
+class HelpCacheInvalidation:
+    """bot mixin keeping the help embed cache up to date; reloading an extension removes and adds its cogs"""
+    def add_cog(self, cog, **kwargs):
+        super().add_cog(cog, **kwargs)
+        CustomHelpCommand.embed_cache.invalidate_cog(cog)
+
+    def remove_cog(self, name, **kwargs):
+        cog = self.get_cog(name)
+        super().remove_cog(name, **kwargs)
+        if cog is not None:
+            CustomHelpCommand.embed_cache.invalidate_cog(cog)
+
+    def add_command(self, command, **kwargs):
+        super().add_command(command, **kwargs)
+        CustomHelpCommand.embed_cache.invalidate_command(command)
+
+    def remove_command(self, name, **kwargs):
+        command = super().remove_command(name, **kwargs)
+        if command is not None:
+            CustomHelpCommand.embed_cache.invalidate_command(command)
+        return command
+
+
+def paginate(title: str, description: str, fields: List[Tuple[str, str]]) -> List[discord.Embed]:
+    """spread fields over as many embeds as discord's limits require"""
+    # split field values that are too long, at line breaks
+    split_fields = []
+    for name, value in fields:
+        value = value or '-'
+        while len(value) > EMBED_FIELD_VALUE_LIMIT:
+            cut = value.rfind('\n', 0, EMBED_FIELD_VALUE_LIMIT)
+            if cut <= 0:
+                cut = EMBED_FIELD_VALUE_LIMIT
+            split_fields.append((name, value[:cut]))
+            value = value[cut:].lstrip('\n')
+            name = f'{name} (continued)' if not name.endswith('(continued)') else name
+        split_fields.append((name, value))
+
+    pages = [discord.Embed(title=title, description=description, color=embedColor)]
+    for name, value in split_fields:
+        page = pages[-1]
+        if len(page.fields) >= EMBED_FIELD_LIMIT or len(page) + len(name) + len(value) > EMBED_TOTAL_LIMIT:
+            page = discord.Embed(title=title, description=description, color=embedColor)
+            pages.append(page)
+
+        page.add_field(name=name, value=value, inline=False)
+
+    if len(pages) > 1:
+        for number, page in enumerate(pages, start=1):
+            page.title = f'{title} ({number}/{len(pages)})'
+
+    return pages
+
+
 # class fpr custom help command
 class CustomHelpCommand(commands.HelpCommand):
+    embed_cache = HelpEmbedCache()
 
     def __init__(self):
         self.name = 'help'
@@ -28,102 +147,54 @@ class CustomHelpCommand(commands.HelpCommand):
 
         super().__init__()
 
-    async def send_bot_help(self, mapping):
-        global embedColor
-        time = datetime.datetime.now()
-        formatted_time = time.strftime('%H:%M')
+    async def send_pages(self, pages: List[discord.Embed]) -> None:
+        """send cached embeds with the current time in the footer"""
+        formatted_time = datetime.datetime.now().strftime('%H:%M')
+        destination = self.get_destination()
 
-        # design embed
-        embed = discord.Embed(title='Help - Bot',
-                              description='An overview of all available commands\n',
-                              color=embedColor)
+        for page in pages:
+            embed = page.copy()
+            embed.set_footer(text=f'BerbBot - {formatted_time}')
 
-        embed.set_footer(text=f'BerbBot - {formatted_time}')
+            await self.context.bot.send_scheduler.send(destination, embed=embed)
 
-        # add content
-        for cog in mapping:
-            if cog is not None:
-                if 'listener' in cog.qualified_name.lower():
-                    break
+    async def send_bot_help(self, mapping):
+        def build():
+            fields = []
+            for cog in mapping:
+                # listeners do not have commands worth showing
+                if cog is None or 'listener' in cog.qualified_name.lower():
+                    continue
 
                 cog_name = cog.qualified_name
                 cog_commands = '\n'.join(command.name for command in mapping[cog])
+                fields.append((cog_name, cog_commands))
 
-                embed.add_field(name=cog_name,
-                                value=cog_commands,
-                                inline=False)
+            return paginate('Help - Bot', 'An overview of all available commands\n', fields)
 
-        # send embed
-        await self.get_destination().send(embed=embed)
+        await self.send_pages(self.embed_cache.get(('bot',), build))
 
     async def send_cog_help(self, cog):
-        global embedColor
-        time = datetime.datetime.now()
-        formatted_time = time.strftime('%H:%M')
-
-        # create embed
-        embed = discord.Embed(title='Help - Cog',
-                              description=f'{cog.description}\n',
-                              color=embedColor)
-
-        cog_commands = '\n'.join(command.name for command in cog.get_commands())
-        embed.add_field(name=cog.qualified_name,
-                        value=cog_commands,
-                        inline=False)
+        def build():
+            cog_commands = '\n'.join(command.name for command in cog.get_commands())
+            return paginate('Help - Cog', f'{cog.description}\n', [(cog.qualified_name, cog_commands)])
 
-        embed.set_footer(text=f'BerbBot - {formatted_time}')
-
-        # send embed
-        await self.get_destination().send(embed=embed)
+        await self.send_pages(self.embed_cache.get(('cog', cog.qualified_name), build))
 
     async def send_group_help(self, group):
-        global embedColor
-        time = datetime.datetime.now()
-        formatted_time = time.strftime('%H:%M')
-
-        # create embed
-        embed = discord.Embed(title='Help - Group',
-                              description=f'{group.description}\n',
-                              color=embedColor)
-
-        group_commands = '\n'.join(command.name for index, command in enumerate(group.commands))
-        embed.add_field(name=group.name,
-                        value=group_commands,
-                        inline=False)
+        def build():
+            group_commands = '\n'.join(command.name for command in group.commands)
+            return paginate('Help - Group', f'{group.description}\n', [(group.name, group_commands)])
 
-        embed.set_footer(text=f'BerbBot - {formatted_time}')
-
-        # send embed
-        await self.get_destination().send(embed=embed)
+        await self.send_pages(self.embed_cache.get(('group', group.qualified_name), build))
 
     async def send_command_help(self, command):
-        global embedColor
-        time = datetime.datetime.now()
-        formatted_time = time.strftime('%H:%M')
-
-        # create embed
-        # include help for the help command itself
-        if command.qualified_name == 'help':
-            embed = discord.Embed(title=f'Help - Command',
-                                  description=f'{self.description}\n',
-                                  color=embedColor)
-
-            embed.add_field(name=self.name,
-                            value=f'`{self.usage}`',
-                            inline=False)
+        def build():
+            # include help for the help command itself
+            if command.qualified_name == 'help':
+                return paginate('Help - Command', f'{self.description}\n', [(self.name, f'`{self.usage}`')])
 
-            embed.set_footer(text=f'BerbBot - {formatted_time}')
-
-        else:
-            embed = discord.Embed(title=f'Help - Command',
-                                  description=f'{command.description}\n',
-                                  color=embedColor)
-
-            embed.add_field(name=command.name,
-                            value=f'`{self.get_command_signature(command)}`',
-                            inline=False)
-
-            embed.set_footer(text=f'BerbBot - {formatted_time}')
+            return paginate('Help - Command', f'{command.description}\n',
+                            [(command.name, f'`{self.get_command_signature(command)}`')])
 
-        # send embed
-        await self.get_destination().send(embed=embed)
+        await self.send_pages(self.embed_cache.get(('command', command.qualified_name, self.clean_prefix), build))
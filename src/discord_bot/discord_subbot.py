@@ -1,68 +1,356 @@
 # imports
+from startup_timer import StartupTimer
+"""start measuring before anything else is imported"""
+startupTimer = StartupTimer()
+
 import os
-import datetime
+import asyncio
 import logging
 from logging import config
 import dotenv
 import discord
 from discord.ext import commands
-from custom_help_command import CustomHelpCommand
+import logging_setup
+from custom_help_command import CustomHelpCommand, HelpCacheInvalidation
+from send_scheduler import SendScheduler
+from prefix_matcher import PrefixMatcher
+from event_store import EventStore
+import metrics
+from runtime_profiler import RuntimeProfiler, StallDetector
+import extension_manifest
+from extension_watcher import ExtensionWatcher
+from shard_supervisor import ShardSupervisor
+import runtime_mode
+
+
+# dotenv
+"""import secrets and vars from .env file because of security and configuration reasons"""
+with startupTimer.phase('dotenv'):
+    dotenv.load_dotenv()
+logFormat = os.getenv('LOG_FORMAT', 'text')
+logFileName = os.getenv('LOG_FILE', 'logs/subbot.log')
 
 
 # logging
-"""configure .log file name"""
-logFileName = f'logs/log_-_{datetime.datetime.now().isoformat().replace(":", "-")}.log'
+"""configure .log file name; the file is rotated and compressed by its handler (see logging.conf)"""
+os.makedirs(os.path.dirname(logFileName) or '.', exist_ok=True)
 
 """configure root logger; set up basic logger"""
-logging.config.fileConfig('../logging.conf', defaults={'logfilename': logFileName})
+with startupTimer.phase('logging config'):
+    # keep the loggers of modules imported above
+    logging.config.fileConfig('../logging.conf',
+                              defaults={'logfilename': logFileName,
+                                        'fileformatter': 'jsonFormatter' if logFormat == 'json' else 'fileFormatter'},
+                              disable_existing_loggers=False)
+
+    # write logs from a background thread instead of the event loop
+    logListener = logging_setup.start_queue_listener()
 logger = logging.getLogger(__name__)
+startupTimer.report('dotenv')
+startupTimer.mark('imports and logging config')
 
 
-# dotenv
-"""import secrets and vars from .env file because of security and configuration reasons"""
-dotenv.load_dotenv()
+# configuration
 discordToken = os.getenv('DISCORD_TOKEN')
+discordApiBase = os.getenv('DISCORD_API_BASE', '')
+sendRateLimit = int(os.getenv('SEND_RATE_LIMIT', '5'))
+sendRatePeriod = float(os.getenv('SEND_RATE_PERIOD', '5'))
+intentsProfile = os.getenv('INTENTS_PROFILE', 'lean')
+intentsOverride = os.getenv('INTENTS', '')
+memberCache = os.getenv('MEMBER_CACHE', '')
+chunkGuildsAtStartup = os.getenv('CHUNK_GUILDS_AT_STARTUP', '')
+maxMessages = os.getenv('MAX_MESSAGES', '')
+hotReload = os.getenv('HOT_RELOAD', 'false').lower() in ('1', 'true', 'yes')
+hotReloadInterval = float(os.getenv('HOT_RELOAD_INTERVAL', '1'))
+commandPrefixes = [prefix for prefix in os.getenv('COMMAND_PREFIXES', 'sb1').split(',') if prefix]
+guildPrefixesFile = os.getenv('GUILD_PREFIXES_FILE', 'guild_prefixes.json')
+databasePath = os.getenv('DATABASE_PATH', 'subbot.db')
+databaseBatchSize = int(os.getenv('DATABASE_BATCH_SIZE', '500'))
+databaseFlushInterval = float(os.getenv('DATABASE_FLUSH_INTERVAL', '0.5'))
+metricsHost = os.getenv('METRICS_HOST', 'localhost')
+metricsPort = int(os.getenv('METRICS_PORT', '9100'))
+loopLagInterval = float(os.getenv('LOOP_LAG_INTERVAL', '0.5'))
+profileDir = os.getenv('PROFILE_DIR', 'profiles')
+profileSampleInterval = float(os.getenv('PROFILE_SAMPLE_INTERVAL', '0.005'))
+stallThreshold = float(os.getenv('STALL_THRESHOLD', '0.5'))
+shardMode = os.getenv('SHARD_MODE', 'single')
+shardCount = os.getenv('SHARD_COUNT', '')
+shardIds = os.getenv('SHARD_IDS', '')
+shardProcesses = int(os.getenv('SHARD_PROCESSES', '2'))
+shardStartDelay = float(os.getenv('SHARD_START_DELAY', '5'))
+shutdownTimeout = float(os.getenv('SHUTDOWN_TIMEOUT', '10'))
+runtimeMode = os.getenv('RUNTIME_MODE', 'default')
+
+
+# gateway intents and caches
+"""
+the subbot relays commands of the main bot, its cogs only need guilds (channel cache) and messages (commands).
+the lean profile drops presences, members, typing etc., which the 'all' profile receives and caches for every guild
+"""
+INTENT_PROFILES = {
+    'lean': ['guilds', 'guild_messages', 'dm_messages'],
+    'all': [flag for flag in discord.Intents.VALID_FLAGS],
+}
+
+
+def build_intents() -> discord.Intents:
+    """intents from INTENTS (comma separated flag names) or INTENTS_PROFILE"""
+    if intentsOverride:
+        flags = [flag.strip() for flag in intentsOverride.split(',') if flag.strip()]
+    else:
+        flags = INTENT_PROFILES[intentsProfile]
+
+    return discord.Intents(**{flag: True for flag in flags})
+
+
+def build_member_cache_flags(intents: discord.Intents) -> discord.MemberCacheFlags:
+    """member cache from MEMBER_CACHE ('none', 'all', 'from_intents' or comma separated flag names)"""
+    setting = memberCache or ('from_intents' if intentsProfile == 'all' else 'none')
+
+    if setting == 'none':
+        return discord.MemberCacheFlags.none()
+    if setting == 'all':
+        return discord.MemberCacheFlags.all()
+    if setting == 'from_intents':
+        return discord.MemberCacheFlags.from_intents(intents)
+
+    flags = [flag.strip() for flag in setting.split(',') if flag.strip()]
+    return discord.MemberCacheFlags(**{flag: True for flag in flags})
+
+
+def build_cache_options(intents: discord.Intents) -> dict:
+    """keyword arguments for the bot controlling what it caches"""
+    # chunking needs the members intent, without it there is nothing to chunk
+    if chunkGuildsAtStartup:
+        chunk_guilds = chunkGuildsAtStartup.lower() in ('1', 'true', 'yes')
+    else:
+        chunk_guilds = intents.members
+
+    # the message cache only serves edit/delete events of old messages, the subbot does not listen to them
+    if maxMessages:
+        max_messages = int(maxMessages) or None
+    else:
+        max_messages = 1000 if intentsProfile == 'all' else None
+
+    return {'member_cache_flags': build_member_cache_flags(intents),
+            'chunk_guilds_at_startup': chunk_guilds,
+            'max_messages': max_messages}
+
+
+# discord api
+"""another REST base url, e.g. a local fake API for benchmarks; the gateway url is asked from the REST api"""
+if discordApiBase:
+    discord.http.Route.BASE = discordApiBase
+
+
+# runtime mode
+"""event loop and json codec (see runtime_mode), installed before the client takes its event loop"""
+with startupTimer.phase('runtime mode'):
+    runtime = runtime_mode.install(runtimeMode)
+logger.info(f'runtime mode {runtimeMode}: {runtime["event_loop"]} event loop, {runtime["json"]} codec')
+
+
+# sharding
+"""
+SHARD_MODE
+    single      one gateway connection for all guilds
+    auto        several shards (gateway connections) in this process, SHARD_COUNT defaults to discord's recommendation;
+                SHARD_IDS limits the process to some of them
+    processes   this process only supervises SHARD_PROCESSES workers, each running a group of the SHARD_COUNT shards
+"""
+
+
+def build_shard_options() -> dict:
+    """keyword arguments for the sharded bot"""
+    options = {}
+    if shardCount:
+        options['shard_count'] = int(shardCount)
+    if shardIds:
+        options['shard_ids'] = [int(shard_id) for shard_id in shardIds.split(',') if shard_id.strip()]
+
+    return options
 
 
 # create subbot
+class SubBot(HelpCacheInvalidation, commands.Bot):
+    """the bot, keeping the help embed cache in sync with its cogs and commands"""
+    pass
+
+
+class ShardedSubBot(HelpCacheInvalidation, commands.AutoShardedBot):
+    """the bot running several shards in one process"""
+    async def before_identify_hook(self, shard_id, *, initial=False):
+        """discord allows one IDENTIFY per 5 seconds; SHARD_START_DELAY can lower it, e.g. for a local fake gateway"""
+        if not initial:
+            await asyncio.sleep(shardStartDelay)
+
+
 """create the client (bot)"""
-intents = discord.Intents.all()
-client = commands.Bot(command_prefix=commands.when_mentioned_or(*['sb1']),
-                      strip_after_prefix=True,
-                      case_insensitive=True,
-                      intents=intents,
-                      help_command=CustomHelpCommand())
+intents = build_intents()
+prefixMatcher = PrefixMatcher.from_file(commandPrefixes, guildPrefixesFile)
+if shardMode == 'single':
+    client = SubBot(command_prefix=prefixMatcher,
+                    strip_after_prefix=True,
+                    case_insensitive=True,
+                    intents=intents,
+                    help_command=CustomHelpCommand(),
+                    **build_cache_options(intents))
+else:
+    client = ShardedSubBot(command_prefix=prefixMatcher,
+                           strip_after_prefix=True,
+                           case_insensitive=True,
+                           intents=intents,
+                           help_command=CustomHelpCommand(),
+                           **build_cache_options(intents),
+                           **build_shard_options())
+logger.info(f'intents: {", ".join(flag for flag, enabled in intents if enabled)}')
+
+"""outgoing messages of extensions go through the send scheduler"""
+client.send_scheduler = SendScheduler(client.loop, rate=sendRateLimit, per=sendRatePeriod)
+
+"""persistent state of listeners and the main bot link, written from a background thread"""
+client.event_store = EventStore(databasePath, batch_size=databaseBatchSize, flush_interval=databaseFlushInterval)
+
+"""prefixes can be changed per guild through the matcher"""
+client.prefix_matcher = prefixMatcher
+
+"""the logging pipeline, flushed when shutting down"""
+client.log_listener = logListener
+
+"""counters, histograms and gauges of the subbot and its extensions, served on METRICS_PORT (0 disables it)"""
+client.metrics = metrics.MetricsRegistry()
+metrics.instrument_http(client.http, client.metrics)
+
+"""objects counting anyway are read when scraped instead of being updated on every event"""
+client.metrics.gauge('subbot_gateway_latency_seconds', 'heartbeat latency of the gateway connection',
+                     collect=lambda: client.latency)
+client.metrics.counter('subbot_send_scheduler_total', 'messages of the send scheduler by stage', ('stage',),
+                       collect=lambda: {(stage,): value for stage, value in client.send_scheduler.stats().items()
+                                        if stage != 'queued'})
+client.metrics.gauge('subbot_send_scheduler_queued', 'messages waiting in the send scheduler',
+                     collect=lambda: client.send_scheduler.stats()['queued'])
+client.metrics.counter('subbot_prefix_filter_total', 'messages checked by the prefix pre-filter', ('result',),
+                       collect=lambda: {('passed',): prefixMatcher.passed, ('filtered',): prefixMatcher.filtered})
+client.metrics.counter('subbot_help_cache_total', 'lookups of the help embed cache', ('result',),
+                       collect=lambda: {('hit',): CustomHelpCommand.embed_cache.hits,
+                                        ('miss',): CustomHelpCommand.embed_cache.misses})
+client.metrics.counter('subbot_event_store_written_total', 'events written to the database',
+                       collect=lambda: client.event_store.written)
+client.metrics.gauge('subbot_event_store_queued', 'events waiting for the database writer',
+                     collect=lambda: client.event_store.queue.qsize())
+client.metrics.gauge('subbot_startup_milestone_seconds', 'seconds from starting until a startup milestone',
+                     ('milestone',),
+                     collect=lambda: {(name,): elapsed for name, elapsed in startupTimer.milestones.items()})
+client.metrics.gauge('subbot_cached_objects', 'users and guild members in the gateway cache (see INTENTS_PROFILE)',
+                     ('kind',), collect=lambda: {('users',): len(client.users),
+                                                 ('members',): sum(len(guild.members) for guild in client.guilds)})
+
+"""profiling sessions started by the profiling cog or the main bot, and the watchdog for a blocked event loop"""
+client.profiler = RuntimeProfiler(profileDir, sample_interval=profileSampleInterval)
+client.stall_detector = StallDetector(client.loop, stallThreshold) if stallThreshold > 0 else None
+client.metrics.counter('subbot_event_loop_stalls_total', 'callbacks blocking the event loop longer than the threshold',
+                       collect=lambda: client.stall_detector.stalls if client.stall_detector is not None else 0)
+
+"""extensions can look up how long the startup took"""
+client.startup_timer = startupTimer
+
+"""state extensions hand over to their next version when they are reloaded"""
+client.extension_state = {}
+lazyExtensions = None
+
+
+# events
+@client.event
+async def on_message(message):
+    """load lazy extensions before the command they provide is processed"""
+    # most messages are not meant for the bot, drop them before any prefix resolution
+    if message.author.bot or not prefixMatcher.matches(client, message):
+        return
+
+    if lazyExtensions is not None:
+        await lazyExtensions.prepare(message)
+
+    await client.process_commands(message)
+
+
+@client.listen('on_connect')
+async def mark_connected():
+    """login and the gateway connection are done"""
+    startupTimer.mark('login and gateway connect')
+
+
+@client.listen('on_ready')
+async def mark_ready():
+    """READY (and guild streaming) is done"""
+    startupTimer.mark('ready')
 
 
 # define main function for running bot
 def main():
     """runs the code and starts the client"""
+    global lazyExtensions
+
+    # the supervisor only starts and watches the workers, which run the shards
+    if shardMode == 'processes':
+        logger.info(f'running {shardCount or shardProcesses} shards in {shardProcesses} processes')
+        ShardSupervisor(__file__, int(shardCount) if shardCount else shardProcesses, shardProcesses,
+                        start_delay=shardStartDelay, metrics_port=metricsPort).run()
+        return
+
     logger.info('loading extensions...')
-    """load all the available extensions from "ext" folder"""
-    # initialize dictionary for saving path.to.files: [filenames]
-    dir_name_filenames_dict = {}
-
-    # get all files from directories and subdirectories
-    for (dir_path, dir_name, file_names) in os.walk('./ext'):
-        dotted_dir_path = dir_path.replace('./', '').replace('\\', '.')
-        dir_name_filenames_dict[dotted_dir_path] = file_names
-
-    # try loading all the files that end on .py
-    for dotted_dir_path in dir_name_filenames_dict.keys():
-        for file_name in dir_name_filenames_dict[dotted_dir_path]:
-            if file_name.endswith('.py'):
-                try:
-                    if not file_name == 'discord_subbot.py':
-                        client.load_extension(f"{dotted_dir_path}.{file_name[:-3]}")
-                        logger.info(f'successfully loaded extension {dotted_dir_path}.{file_name[:-3]}')
-                except Exception as error:
-                    logger.critical(f'failed loading extension {dotted_dir_path}.{file_name[:-3]}')
-                    logger.error(f'error: "{error}"')
+    """load the extensions listed in the manifest of the "ext" folder"""
+    with startupTimer.phase('extension manifest'):
+        manifest = extension_manifest.load('./ext')
+        lazyExtensions = extension_manifest.LazyExtensionLoader(client, manifest, prefixMatcher)
+
+    # import what the extensions depend on in parallel
+    with startupTimer.phase('preloading extension imports'):
+        extension_manifest.preload(manifest)
+
+    # lazy extensions are loaded by on_message once they are needed
+    for entry in manifest:
+        if entry['lazy']:
+            logger.info(f'deferring lazy extension {entry["name"]}')
+            continue
+
+        try:
+            with startupTimer.phase(f'loading extension {entry["name"]}'):
+                client.load_extension(entry['name'])
+            logger.info(f'successfully loaded extension {entry["name"]}')
+        except Exception as error:
+            logger.critical(f'failed loading extension {entry["name"]}')
+            logger.error(f'error: "{error}"')
+
+    # start writing persistent state
+    with startupTimer.phase('event store'):
+        client.event_store.start()
+
+    # expose metrics and measure how late the event loop runs callbacks
+    if metricsPort:
+        client.loop.create_task(metrics.MetricsServer(client.metrics, metricsHost, metricsPort).start())
+    client.loop.create_task(metrics.watch_loop_lag(client.metrics, loopLagInterval))
+
+    # log the stack of callbacks blocking the event loop; client.run() runs the loop on this thread
+    if client.stall_detector is not None:
+        client.stall_detector.start()
+
+    # reload changed extensions while running
+    if hotReload:
+        client.loop.create_task(ExtensionWatcher(client, './ext', hotReloadInterval).run())
 
     # run
     logger.info('executing...')
     """run the code and start the client"""
-    client.run(discordToken)
+    try:
+        client.run(discordToken)
+    finally:
+        if client.stall_detector is not None:
+            client.stall_detector.stop()
+        client.profiler.stop_all()
+
+        # write what is still queued; after a SHUTDOWN from the main bot the event store is closed already
+        client.event_store.close(shutdownTimeout)
+        logging_setup.stop_queue_listener(client.log_listener)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,182 @@
+# imports
+import time
+import queue
+import asyncio
+import logging
+import sqlite3
+import threading
+from collections import Counter
+from typing import List, Optional
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# schema
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS command_audit (
+    id          INTEGER PRIMARY KEY,
+    time        REAL NOT NULL,
+    request_id  INTEGER,
+    opcode      INTEGER NOT NULL,
+    target_id   INTEGER NOT NULL,
+    status      TEXT NOT NULL,
+    message_id  INTEGER,
+    error       TEXT
+);
+CREATE INDEX IF NOT EXISTS command_audit_target_time ON command_audit (target_id, time);
+CREATE INDEX IF NOT EXISTS command_audit_time ON command_audit (time);
+
+CREATE TABLE IF NOT EXISTS channel_counters (
+    channel_id  INTEGER PRIMARY KEY,
+    messages    INTEGER NOT NULL,
+    updated     REAL NOT NULL
+);
+'''
+
+INSERT_COMMAND = ('INSERT INTO command_audit (time, request_id, opcode, target_id, status, message_id, error) '
+                  'VALUES (?, ?, ?, ?, ?, ?, ?)')
+UPSERT_COUNTER = ('INSERT INTO channel_counters (channel_id, messages, updated) VALUES (?, ?, ?) '
+                  'ON CONFLICT (channel_id) DO UPDATE SET messages = messages + excluded.messages, '
+                  'updated = excluded.updated')
+
+# queue items
+COMMAND = 0
+MESSAGE = 1
+
+
+# store
+class EventStore:
+    """sqlite persistence for the command audit and per-channel counters
+
+    record_*() only put the event into a queue, they never block the event loop. a dedicated thread owns the
+    write connection (WAL mode) and writes the queued events in one transaction per batch, once batch_size events
+    are waiting or flush_interval seconds passed. message counters are summed up per batch before writing
+    """
+    def __init__(self, path: str, batch_size: int = 500, flush_interval: float = 0.5):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        self.queue = queue.SimpleQueue()
+        self.thread = None
+        self.written = 0
+
+    # writing
+    def start(self) -> None:
+        # create the tables before anyone reads
+        connection = self.connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+
+        self.thread = threading.Thread(target=self.write_loop, name='event-store', daemon=True)
+        self.thread.start()
+
+    def record_command(self, request_id: int, opcode: int, target_id: int, status: str,
+                       message_id: Optional[int] = None, error: Optional[str] = None) -> None:
+        self.queue.put((COMMAND, (time.time(), request_id, opcode, target_id, status, message_id, error)))
+
+    def count_message(self, channel_id: int) -> None:
+        self.queue.put((MESSAGE, channel_id))
+
+    def close(self, timeout: float = None) -> None:
+        """write everything queued so far and stop the writer thread"""
+        if self.thread is None:
+            return
+
+        self.queue.put(None)
+        self.thread.join(timeout)
+        if self.thread.is_alive():
+            logger.warning(f'event store did not finish writing within {timeout}s')
+        self.thread = None
+
+    def connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        connection.execute('PRAGMA journal_mode=WAL')
+        connection.execute('PRAGMA synchronous=NORMAL')
+        return connection
+
+    def write_loop(self) -> None:
+        connection = self.connect()
+
+        running = True
+        while running:
+            batch = []
+            deadline = time.monotonic() + self.flush_interval
+
+            # collect until the batch is full, the interval passed or the store is closed
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is None:
+                    running = False
+                    break
+                batch.append(item)
+
+            if batch:
+                try:
+                    self.write(connection, batch)
+                except sqlite3.Error as error:
+                    logger.error(f'failed writing {len(batch)} events: "{error}"')
+
+        connection.close()
+
+    def write(self, connection: sqlite3.Connection, batch: list) -> None:
+        commands = [event for kind, event in batch if kind == COMMAND]
+        messages = Counter(event for kind, event in batch if kind == MESSAGE)
+        now = time.time()
+
+        connection.execute('BEGIN')
+        try:
+            if commands:
+                connection.executemany(INSERT_COMMAND, commands)
+            if messages:
+                connection.executemany(UPSERT_COUNTER, [(channel_id, count, now)
+                                                        for channel_id, count in messages.items()])
+        except BaseException:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+
+        self.written += len(batch)
+
+    # reading
+    def read(self, sql: str, parameters: tuple) -> List[sqlite3.Row]:
+        connection = self.connect()
+        connection.row_factory = sqlite3.Row
+        try:
+            return connection.execute(sql, parameters).fetchall()
+        finally:
+            connection.close()
+
+    async def query_commands(self, target_id: Optional[int] = None, since: Optional[float] = None,
+                             limit: int = 100) -> List[sqlite3.Row]:
+        """latest audited commands, optionally of one channel / user and newer than a unix time"""
+        conditions, parameters = [], []
+        if target_id is not None:
+            conditions.append('target_id = ?')
+            parameters.append(target_id)
+        if since is not None:
+            conditions.append('time >= ?')
+            parameters.append(since)
+
+        where = f'WHERE {" AND ".join(conditions)} ' if conditions else ''
+        sql = f'SELECT * FROM command_audit {where}ORDER BY time DESC LIMIT ?'
+        parameters.append(limit)
+
+        return await asyncio.get_event_loop().run_in_executor(None, self.read, sql, tuple(parameters))
+
+    async def query_channel_counters(self, channel_id: Optional[int] = None) -> List[sqlite3.Row]:
+        if channel_id is None:
+            sql, parameters = 'SELECT * FROM channel_counters ORDER BY messages DESC', ()
+        else:
+            sql, parameters = 'SELECT * FROM channel_counters WHERE channel_id = ?', (channel_id,)
+
+        return await asyncio.get_event_loop().run_in_executor(None, self.read, sql, parameters)
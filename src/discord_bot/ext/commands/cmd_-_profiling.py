@@ -0,0 +1,106 @@
+# imports
+import os
+import logging
+import dotenv
+import discord
+from discord.ext import commands
+import datetime
+from runtime_profiler import KINDS, ProfileResult, ProfilingError
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# dotenv
+"""import secrets and vars from .env file because of security and configuration reasons"""
+dotenv.load_dotenv()
+embedColor = int(os.getenv('EMBED_COLOR'))
+errorEmbedColor = int(os.getenv('ERROR_EMBED_COLOR'))
+
+
+# extension
+class ProfilingCommands(commands.Cog, name='Profiling',
+                        description='owner only: profile the running subbot (cprofile, sampling, tracemalloc)'):
+    """cog for profiling commands"""
+    def __init__(self, client):
+        self.client = client
+
+    async def cog_check(self, ctx):
+        """every command of the cog is owner only"""
+        if not await self.client.is_owner(ctx.author):
+            raise commands.NotOwner('You do not own this bot.')
+        return True
+
+    async def send_embed(self, ctx, description: str, summary: str = None, color: int = embedColor):
+        formatted_time = datetime.datetime.now().strftime('%H:%M')
+
+        embed = discord.Embed(title='Profiling', description=description, color=color)
+        if summary:
+            # keep the summary inside one field
+            embed.add_field(name='Summary', value=f'```\n{summary[:1000]}\n```', inline=False)
+        embed.set_footer(text=f'BerbBot - {formatted_time}')
+
+        await self.client.send_scheduler.send(ctx, embed=embed)
+
+    async def send_result(self, ctx, kind: str, result: ProfileResult):
+        await self.send_embed(ctx, f'{kind} session written to `{result.path}`', result.summary)
+
+    @commands.group(name='profile', description='start and stop profiling sessions, show event loop stalls',
+                    usage=f'.profile <start/stop/run/stalls> [{"/".join(KINDS)}] [seconds]',
+                    invoke_without_command=True)
+    async def profile(self, ctx):
+        await ctx.send_help(ctx.command)
+
+    @profile.command(name='start', description='start a profiling session, which runs until it is stopped',
+                     usage=f'.profile start <{"/".join(KINDS)}>')
+    async def start(self, ctx, kind: str.lower):
+        try:
+            self.client.profiler.start(kind)
+        except ProfilingError as error:
+            return await self.send_embed(ctx, str(error), color=errorEmbedColor)
+
+        await self.send_embed(ctx, f'started {kind} session')
+
+    @profile.command(name='stop', description='stop a profiling session and write it to disk',
+                     usage=f'.profile stop <{"/".join(KINDS)}>')
+    async def stop(self, ctx, kind: str.lower):
+        try:
+            result = await self.client.profiler.stop(kind)
+        except ProfilingError as error:
+            return await self.send_embed(ctx, str(error), color=errorEmbedColor)
+
+        await self.send_result(ctx, kind, result)
+
+    @profile.command(name='run', description='profile the given number of seconds and write the session to disk',
+                     usage=f'.profile run <{"/".join(KINDS)}> <seconds>')
+    async def run(self, ctx, kind: str.lower, seconds: float):
+        try:
+            result = await self.client.profiler.run_for(kind, seconds)
+        except ProfilingError as error:
+            return await self.send_embed(ctx, str(error), color=errorEmbedColor)
+
+        await self.send_result(ctx, kind, result)
+
+    @profile.command(name='stalls', description='show how often a callback blocked the event loop',
+                     usage='.profile stalls')
+    async def stalls(self, ctx):
+        detector = self.client.stall_detector
+        if detector is None:
+            return await self.send_embed(ctx, 'the stall detector is disabled (STALL_THRESHOLD=0)')
+
+        await self.send_embed(ctx, f'{detector.stalls} callbacks blocked the event loop for more than '
+                                   f'{detector.threshold * 1000:.0f}ms, their stacks are in the log')
+
+
+# cog related functions
+def setup(client):
+    """load extensions"""
+    logger.info(f'loading extension: {os.path.basename(__file__)}')
+    client.add_cog(ProfilingCommands(client))
+
+
+def teardown(client):
+    """send information when extension is being unloaded"""
+    logger.info(f'unloading extension: {os.path.basename(__file__)}')
@@ -2,11 +2,14 @@
 import os
 import sys
 import dotenv
-import traceback
+import time
+import functools
 import logging
 import discord
 from discord.ext import commands
 import datetime
+from typing import Dict, NamedTuple, Optional, Tuple, Type
+from traceback_reporter import TracebackReporter
 
 
 # logging
@@ -18,6 +21,52 @@ logger = logging.getLogger(__name__)
 """import secrets and vars from .env file because of security and configuration reasons"""
 dotenv.load_dotenv()
 errorEmbedColor = int(os.getenv('ERROR_EMBED_COLOR'))
+tracebackReportWindow = float(os.getenv('TRACEBACK_REPORT_WINDOW', '60'))
+
+
+# error responses
+class ErrorResponse(NamedTuple):
+    """static parts of the embed sent for one type of error; {prefix} and {command} are filled in per invocation"""
+    description: str
+    # (name, value) of an extra field
+    field: Optional[Tuple[str, str]] = None
+
+
+USAGE_FIELD = ('Usage', '`{prefix}{qualified_name} {signature}`')
+
+"""error type: response; subclasses are resolved through their MRO, so e.g. MemberNotFound uses BadArgument"""
+ERROR_RESPONSES: Dict[Type[Exception], ErrorResponse] = {
+    # bot-related errors
+    commands.CommandNotFound: ErrorResponse('This command does not exist',
+                                            ('Help', 'For a list of valid commands use: \n`{prefix}help`')),
+    commands.DisabledCommand: ErrorResponse('`{prefix}{command}` has been disabled.'),
+    commands.BotMissingPermissions: ErrorResponse('I am missing permission to execute `{prefix}{command}`.'),
+    commands.BotMissingRole: ErrorResponse('I do not have the required role to execute `{prefix}{command}`.'),
+
+    # user-related errors
+    commands.MissingPermissions: ErrorResponse('You do not have the required permission to execute '
+                                               '`{prefix}{command}`.'),
+    commands.NotOwner: ErrorResponse('You need to be my owner to execute `{prefix}{command}`.'),
+    commands.NoPrivateMessage: ErrorResponse('`{prefix}{command}` can **NOT** be used in Direct Messages.'),
+    commands.PrivateMessageOnly: ErrorResponse('`{prefix}{command}` can **EXCLUSIVELY** be used in Direct Messages.'),
+    commands.CommandOnCooldown: ErrorResponse('`{prefix}{command}` is currently on cooldown. Try again later.'),
+    commands.MissingRequiredArgument: ErrorResponse('I am missing required arguments to execute '
+                                                    '`{prefix}{command}`. \n', USAGE_FIELD),
+    commands.TooManyArguments: ErrorResponse('`{prefix}{command}` uses less arguments. \n', USAGE_FIELD),
+    commands.BadArgument: ErrorResponse('`{prefix}{command}` uses a different kind of arguments. '
+                                        'You passed an invalid argument\n', USAGE_FIELD),
+}
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_response(error_type: Type[Exception]) -> Optional[ErrorResponse]:
+    """response of the most specific registered base class of the error type, None for unexpected errors"""
+    for base in error_type.__mro__:
+        response = ERROR_RESPONSES.get(base)
+        if response is not None:
+            return response
+
+    return None
 
 
 # extension
@@ -27,13 +76,40 @@ class CommandErrorHandler(commands.Cog, name='On Command Error Listener',
     """cog for on_command_error event"""
     def __init__(self, client):
         self.client = client
+        # error type name: [count, total seconds, max seconds] spent handling it
+        self.handling_stats: Dict[str, list] = {}
+        # deduplicates reports of unexpected errors
+        self.traceback_reporter = TracebackReporter(window=tracebackReportWindow)
+
+        # read from handling_stats when scraped
+        client.metrics.counter('subbot_command_errors_total', 'command errors by type', ('type',),
+                               collect=lambda: {(name,): stats[0] for name, stats in self.handling_stats.items()})
+        client.metrics.counter('subbot_command_error_handling_seconds_total', 'time spent handling command errors',
+                               ('type',),
+                               collect=lambda: {(name,): stats[1] for name, stats in self.handling_stats.items()})
+
+    def cog_unload(self):
+        """keep the error fingerprints for a reloaded version of the cog"""
+        self.client.extension_state[__name__] = self.traceback_reporter
 
     @commands.Cog.listener()
     async def on_command_error(self, ctx, error):
         """"handle occurring command errors"""
+        start = time.perf_counter()
+
+        try:
+            await self.handle_error(ctx, error)
+        finally:
+            elapsed = time.perf_counter() - start
+            stats = self.handling_stats.setdefault(type(error).__name__, [0, 0.0, 0.0])
+            stats[0] += 1
+            stats[1] += elapsed
+            stats[2] = max(stats[2], elapsed)
+            logger.debug(f'handled {type(error).__name__} in {elapsed * 1000:.1f}ms')
+
+    async def handle_error(self, ctx, error):
         global errorEmbedColor
-        time = datetime.datetime.now()
-        formatted_time = time.strftime('%H:%M')
+        formatted_time = datetime.datetime.now().strftime('%H:%M')
 
         # prevent any commands with local handlers being handled here
         if hasattr(ctx.command, 'on_error'):
@@ -50,166 +126,78 @@ class CommandErrorHandler(commands.Cog, name='On Command Error Listener',
         if isinstance(error, ignored):
             return
 
-        async with ctx.typing():
-            # initialize error embed
-            embed = discord.Embed()
-            # initialize formatted traceback
-            formatted_traceback = ''
-
-            # handle occurring errors: prepare error embed
-            # bot-related errors
-            if isinstance(error, commands.CommandNotFound):
-                embed = discord.Embed(title='Error',
-                                      description='This command does not exist',
-                                      color=errorEmbedColor)
-                embed.add_field(name='Help',
-                                value='For a list of valid commands use: \n'
-                                      f'`{self.client.command_prefix(self.client, ctx.message)[2]}help`',
-                                inline=False)
-
-            elif isinstance(error, commands.DisabledCommand):
-                embed = discord.Embed(title='Error',
-                                      description=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}` has been disabled.',
-                                      color=errorEmbedColor)
-
-            elif isinstance(error, commands.BotMissingPermissions):
-                embed = discord.Embed(title='Error',
-                                      description='I am missing permission to execute '
-                                                  f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}`.',
-                                      color=errorEmbedColor)
-
-            elif isinstance(error, commands.BotMissingRole):
-                embed = discord.Embed(title='Error',
-                                      description='I do not have the required role to execute '
-                                                  f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}`.',
-                                      color=errorEmbedColor)
-
-            # user-related errors
-            elif isinstance(error, commands.MissingPermissions):
-                embed = discord.Embed(title='Error',
-                                      description='You do not have the required permission to execute '
-                                                  f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}`.',
-                                      color=errorEmbedColor)
-
-            elif isinstance(error, commands.NotOwner):
-                embed = discord.Embed(title='Error',
-                                      description='You need to be my owner to execute '
-                                                  f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}`.',
-                                      color=errorEmbedColor)
-
-            elif isinstance(error, commands.NoPrivateMessage):
-                try:
-                    embed = discord.Embed(title='Error',
-                                          description=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                      f'{ctx.command}` can **NOT** be used in Direct Messages.',
-                                          color=errorEmbedColor)
-                except discord.HTTPException:
-                    pass
-
-            elif isinstance(error, commands.PrivateMessageOnly):
-                await ctx.send(f'`{self.client.command_prefix(self.client, ctx.message)[2]}{ctx.command}`')
-                try:
-                    embed = discord.Embed(title='Error',
-                                          description=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                      f'{ctx.command}` can **EXCLUSIVELY** be used in Direct Messages.',
-                                          color=errorEmbedColor)
-                except discord.HTTPException:
-                    pass
-
-            elif isinstance(error, commands.CommandOnCooldown):
-                embed = discord.Embed(title='Error',
-                                      description=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}` is currently on cooldown. Try again later.',
-                                      color=errorEmbedColor)
-
-            elif isinstance(error, commands.MissingRequiredArgument):
-                embed = discord.Embed(title='Error',
-                                      description='I am missing required arguments to execute '
-                                                  f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}`. \n',
-                                      color=errorEmbedColor)
-                embed.add_field(name='Usage',
-                                value=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                      f'{ctx.command.qualified_name} {ctx.command.signature}`',
-                                inline=False)
-
-            elif isinstance(error, commands.TooManyArguments):
-                embed = discord.Embed(title='Error',
-                                      description=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}` uses less arguments. \n',
-                                      color=errorEmbedColor)
-                embed.add_field(name='Usage',
-                                value=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                      f'{ctx.command.qualified_name} {ctx.command.signature}`',
-                                inline=False)
-
-            elif isinstance(error, commands.BadArgument):
-                embed = discord.Embed(title='Error',
-                                      description=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}` uses a different kind of arguments. '
-                                                  f'You passed an invalid argument\n',
-                                      color=errorEmbedColor)
-                embed.add_field(name='Usage',
-                                value=f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                      f'{ctx.command.qualified_name} {ctx.command.signature}`',
-                                inline=False)
-
-            # print traceback for all errors not returned
-            else:
-                # print traceback
-                logger.error(f'ignoring exception in command {ctx.command}: {sys.stderr}')
-                traceback.print_exception(type(error), error, error.__traceback__, file=sys.stderr)
-
-                # get traceback as string
-                formatted_traceback = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
-
-                # configure embed
-                embed = discord.Embed(title='Error',
-                                      description=f'Ignoring exception in command '
-                                                  f'`{self.client.command_prefix(self.client, ctx.message)[2]}'
-                                                  f'{ctx.command}`: `{sys.stderr}`',
-                                      color=errorEmbedColor)
-
-            # format embed
-            embed.set_author(name=f'Requested by: {ctx.message.author}',
-                             url='https://www.google.com/',
-                             icon_url=ctx.author.avatar_url)
-            embed.set_thumbnail(url=ctx.author.avatar_url)
-            embed.set_footer(text=f'BerbBot - {formatted_time}')
+        # resolve the prefix once, it is used in most responses
+        prefix = self.client.prefix_matcher.display_prefix(self.client, ctx.message)
 
-        # finally, send error embed
-        # if the traceback is too long for one, send multiple embeds
-        if len(formatted_traceback) > 1024:
-            split_traceback = []
-
-            n = 1024
-            for index in range(0, len(formatted_traceback), n):
-                split_traceback.append(formatted_traceback[index: index + n])
+        # initialize formatted traceback
+        formatted_traceback = ''
+        repeats = 0
 
-            for part in split_traceback:
-                embed.remove_field(0)
-                embed.add_field(name='Traceback',
-                                value=part,
-                                inline=False)
+        # handle occurring errors: prepare error embed
+        response = resolve_response(type(error))
+        if response is not None:
+            values = {'prefix': prefix, 'command': ctx.command}
+            embed = discord.Embed(title='Error',
+                                  description=response.description.format(**values),
+                                  color=errorEmbedColor)
 
-                await ctx.send(embed=embed)
+            if response.field is not None:
+                name, value = response.field
+                if ctx.command is not None:
+                    values.update(qualified_name=ctx.command.qualified_name, signature=ctx.command.signature)
+                embed.add_field(name=name, value=value.format(**values), inline=False)
 
+        # print traceback for all errors not returned
         else:
-            await ctx.send(embed=embed)
+            logger.error(f'ignoring exception in command {ctx.command}: {sys.stderr}')
+
+            # get traceback as string, unless the same error was reported a moment ago
+            report = await self.traceback_reporter.prepare(error)
+            if report is None:
+                return
+            formatted_traceback, repeats = report
+
+            # configure embed
+            embed = discord.Embed(title='Error',
+                                  description=f'Ignoring exception in command '
+                                              f'`{prefix}{ctx.command}`: `{sys.stderr}`',
+                                  color=errorEmbedColor)
+            if repeats:
+                embed.description += f'\nThis error occurred {repeats} more times since it was last reported.'
+
+        # format embed
+        embed.set_author(name=f'Requested by: {ctx.message.author}',
+                         url='https://www.google.com/',
+                         icon_url=ctx.author.avatar_url)
+        embed.set_thumbnail(url=ctx.author.avatar_url)
+        embed.set_footer(text=f'BerbBot - {formatted_time}')
+
+        # finally, send error embed
+        # the traceback goes into the embed if it fits into one message, otherwise it is attached as a file
+        file = None
+        if formatted_traceback:
+            file = self.traceback_reporter.attach(embed, formatted_traceback)
+
+        await self.client.send_scheduler.send(ctx, embed=embed, file=file)
 
 
 # cog related functions
 def setup(client):
     """load extensions"""
     logger.info(f'loading extension: {os.path.basename(__file__)}')
-    client.add_cog(CommandErrorHandler(client))
+    cog = CommandErrorHandler(client)
+
+    # take over the error fingerprints when being reloaded
+    traceback_reporter = client.extension_state.pop(__name__, None)
+    if traceback_reporter is not None:
+        cog.traceback_reporter = traceback_reporter
+
+    client.add_cog(cog)
 
 
 def teardown(client):
     """send information when extension is being unloaded"""
     logger.info(f'unloading extension: {os.path.basename(__file__)}')
+
+    # nothing to stop, drop the fingerprints if no reloaded version picked them up
+    client.loop.call_soon(client.extension_state.pop, __name__, None)
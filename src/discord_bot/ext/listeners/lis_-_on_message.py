@@ -3,7 +3,6 @@ import os
 import logging
 import discord
 from discord.ext import commands
-import sqlite3
 
 
 # logging
@@ -26,6 +25,9 @@ class OnMessageListener(commands.Cog, name='On Message Listener', description='c
         if message.author == self.client.user:
             return
 
+        # per-channel message counter, written in batches by the event store
+        self.client.event_store.count_message(message.channel.id)
+
 
 # cog related functions
 def setup(client):
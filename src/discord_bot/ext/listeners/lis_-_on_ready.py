@@ -1,69 +1,471 @@
 # imports
 import os
+import time
+import random
+import asyncio
+from collections import deque
 import logging
+import dotenv
 import discord
 from discord.ext import commands
-from multiprocessing.connection import Client
+import ipc_protocol
+from ipc_protocol import Opcode
+from ipc_dispatcher import CommandDispatcher
+from object_resolver import ObjectResolver
 
 # logging
 """create logger by inheriting configuration from root logger"""
 logger = logging.getLogger(__name__)
 
 
+# dotenv
+"""import secrets and vars from .env file because of security and configuration reasons"""
+dotenv.load_dotenv()
+ipcHost = os.getenv('IPC_HOST', 'localhost')
+ipcPort = int(os.getenv('IPC_PORT', '9999'))
+ipcMaxPending = int(os.getenv('IPC_MAX_PENDING', '1024'))
+ipcMaxPendingPerTarget = int(os.getenv('IPC_MAX_PENDING_PER_TARGET', '64'))
+resolverCacheSize = int(os.getenv('RESOLVER_CACHE_SIZE', '1024'))
+resolverCacheTTL = float(os.getenv('RESOLVER_CACHE_TTL', '300'))
+ipcHeartbeatInterval = float(os.getenv('IPC_HEARTBEAT_INTERVAL', '5'))
+ipcHeartbeatTimeout = float(os.getenv('IPC_HEARTBEAT_TIMEOUT', '15'))
+ipcReconnectDelay = float(os.getenv('IPC_RECONNECT_DELAY', '0.1'))
+ipcReconnectMaxDelay = float(os.getenv('IPC_RECONNECT_MAX_DELAY', '30'))
+ipcReplayBufferSize = int(os.getenv('IPC_REPLAY_BUFFER_SIZE', '4096'))
+shutdownTimeout = float(os.getenv('SHUTDOWN_TIMEOUT', '10'))
+spamMaxAmount = int(os.getenv('SPAM_MAX_AMOUNT', '1000'))
+
+
+"""metric labels of the opcodes"""
+OPCODE_NAMES = {opcode.value: opcode.name.lower() for opcode in Opcode}
+"""messages of a spam command handed to the send scheduler at once"""
+SPAM_BATCH_SIZE = 50
+
+
 # bot subbot communication
+class WrongShard(Exception):
+    """the target belongs to a guild of a shard another subbot process runs"""
+    pass
+
+
 class BotCommunication:
+    """asyncio based link to the main bot
+
+    commands arrive as length prefixed binary frames (see ipc_protocol), read from an asyncio stream,
+    so waiting for the controller never blocks the event loop.
+    if the link drops, it is reconnected in the background with jittered exponential backoff while the
+    discord session stays up; replies produced in the meantime are buffered (bounded) and sent after reconnecting.
+    SHUTDOWN drains: nothing is read anymore and commands that came with it are refused with BUSY, accepted ones
+    get SHUTDOWN_TIMEOUT seconds to finish (the rest is NACKed), a STATUS frame ends the link and the event store
+    is flushed before the gateway closes
+    """
     def __init__(self, client):
-        # connection to the listener
-        self.connection = Client(('localhost', 9999), authkey=None)
         self.client = client
+        # connection to the listener, opened in connect()
+        self.reader = None
+        self.writer = None
+        self.decoder = ipc_protocol.FrameDecoder()
+        self.pending_frames = []
+        self.last_received = 0.0
+        self.draining = False
+
+        # replies waiting for the link to come back
+        self.outbox = deque(maxlen=ipcReplayBufferSize)
+        self.dropped_replies = 0
+
+        # channels and users the commands are meant for
+        self.resolver = ObjectResolver(client, max_size=resolverCacheSize, ttl=resolverCacheTTL)
+
+        # commands the main bot can send, keyed by opcode
+        self.dispatcher = CommandDispatcher(client.loop, self.report,
+                                            max_pending=ipcMaxPending,
+                                            max_pending_per_target=ipcMaxPendingPerTarget)
+        self.dispatcher.register(Opcode.REPEAT, self.repeat)
+        self.dispatcher.register(Opcode.SPAM_CHANNEL, self.spam_channel)
+        self.dispatcher.register(Opcode.SPAM_USER, self.spam_user)
+        self.dispatcher.register(Opcode.PROFILE_START, self.profile_start)
+        self.dispatcher.register(Opcode.PROFILE_STOP, self.profile_stop)
+
+        # metrics
+        registry = client.metrics
+        self.frames_received = registry.counter('subbot_ipc_frames_received_total', 'frames from the main bot',
+                                                ('opcode',))
+        self.frames_processed = registry.counter('subbot_ipc_commands_processed_total',
+                                                 'commands from the main bot by outcome', ('opcode', 'status'))
+        self.command_latency = registry.histogram('subbot_ipc_command_seconds',
+                                                  'time from receiving a command until discord acknowledged it',
+                                                  ('opcode',))
+        registry.gauge('subbot_ipc_commands_pending', 'commands queued or running in the dispatcher',
+                       collect=lambda: self.dispatcher.pending)
+        registry.gauge('subbot_ipc_replies_buffered', 'replies waiting for the link to come back',
+                       collect=lambda: len(self.outbox))
+        registry.counter('subbot_resolver_lookups_total', 'channel / user lookups by source', ('source',),
+                         collect=lambda: {(source,): value for source, value in self.resolver.stats().items()
+                                          if source not in ('hit_rate', 'cached')})
+        registry.gauge('subbot_resolver_cached', 'channels / users in the resolver cache',
+                       collect=lambda: self.resolver.stats()['cached'])
+        # id of a frame in the dispatcher: (frame, time it was received)
+        self.received = {}
 
-    def authenticate(self) -> bool:
-        self.connection.send(int(self.client.user.id))
-        message = self.connection.recv()
+    async def connect(self) -> None:
+        self.reader, self.writer = await asyncio.open_connection(ipcHost, ipcPort)
+        self.decoder = ipc_protocol.FrameDecoder()
+        self.pending_frames = []
+        self.last_received = time.monotonic()
 
-        if message == 'authentication succeeded':
+    async def close(self) -> None:
+        if self.writer is not None:
+            writer = self.writer
+            self.writer = None
+            self.reader = None
+
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except ConnectionError:
+                pass
+
+    async def send(self, frame: bytes) -> None:
+        self.writer.write(frame)
+        await self.writer.drain()
+
+    async def recv(self) -> ipc_protocol.Frame:
+        # one read can contain many frames, hand them out one by one
+        while not self.pending_frames:
+            data = await self.reader.read(65536)
+            if not data:
+                raise asyncio.IncompleteReadError(b'', None)
+
+            self.last_received = time.monotonic()
+            self.pending_frames = self.decoder.feed(data)
+            self.pending_frames.reverse()
+
+        return self.pending_frames.pop()
+
+    async def authenticate(self) -> bool:
+        await self.send(ipc_protocol.encode_frame(Opcode.AUTH, int(self.client.user.id)))
+        frame = await asyncio.wait_for(self.recv(), ipcHeartbeatTimeout)
+
+        if frame.opcode == Opcode.AUTH_OK:
             return True
 
-        self.connection.close()
+        await self.close()
+        return False
+
+    async def run(self) -> None:
+        """keep the link to the main bot up until the main bot or discord shuts the subbot down"""
+        attempt = 0
+
+        while not self.client.is_closed():
+            logger.info('connecting to main bot...')
+
+            try:
+                await self.connect()
+                authenticated = await self.authenticate()
+            except (OSError, asyncio.IncompleteReadError, asyncio.TimeoutError, ipc_protocol.ProtocolError) as error:
+                logger.error(f'error: "{error!r}"')
+                await self.close()
+                authenticated = False
+
+            if authenticated:
+                logger.info('Connection to main bot established!')
+                attempt = 0
+
+                if await self.serve():
+                    return
+
+            else:
+                logger.info('Could not connect to main bot.')
+
+            # full jitter: wait somewhere between 0 and the capped exponential delay
+            delay = random.uniform(0, min(ipcReconnectMaxDelay, ipcReconnectDelay * 2 ** attempt))
+            attempt += 1
+            logger.info(f'reconnecting to main bot in {delay:.2f}s...')
+            await asyncio.sleep(delay)
+
+    async def serve(self) -> bool:
+        """handle one authenticated connection, returns True if the main bot asked to shut down"""
+        heartbeat = self.client.loop.create_task(self.heartbeat())
+
+        try:
+            self.replay()
+            self.register_shards()
+            await self.flush()
+            return await self.receive_and_handle()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            logger.warning('connection to main bot lost')
+        except ipc_protocol.ProtocolError as error:
+            logger.error(f'invalid frame from main bot, closing connection: "{error}"')
+        finally:
+            heartbeat.cancel()
+            await self.close()
+
         return False
 
-    async def receive_and_handle(self) -> None:
+    async def heartbeat(self) -> None:
+        """ping the main bot and drop the connection if nothing came back in time"""
+        while self.writer is not None:
+            await asyncio.sleep(ipcHeartbeatInterval)
+
+            # nothing is read while draining, the main bot's PONGs would go unnoticed
+            if self.draining:
+                return
+
+            if time.monotonic() - self.last_received > ipcHeartbeatTimeout:
+                logger.warning(f'main bot did not answer for {ipcHeartbeatTimeout}s, dropping connection')
+                self.writer.transport.abort()
+                return
+
+            self.reply(Opcode.PING, 0)
+
+    def reply(self, opcode: int, request_id: int, target: int = 0, text: str = '') -> None:
+        """queue an ACK / RESULT / NACK frame for the request, written as one chunk so replies never interleave"""
+        frame = ipc_protocol.encode_text(opcode, target, text, request_id)
+
+        if self.writer is None:
+            # keepalives are pointless to replay
+            if opcode in (Opcode.PING, Opcode.PONG):
+                return
+
+            if len(self.outbox) == self.outbox.maxlen:
+                self.dropped_replies += 1
+            self.outbox.append(frame)
+            return
+
+        self.writer.write(frame)
+
+    def register_shards(self) -> None:
+        """tell the main bot the guilds of every shard of this process, so it routes their commands here"""
+        shard_ids = getattr(self.client, 'shard_ids', None)
+        for shard_id in shard_ids if shard_ids is not None else range(self.client.shard_count or 1):
+            self.register_shard(shard_id)
+
+    def register_shard(self, shard_id: int) -> None:
+        # registrations are not buffered, serve() registers all shards again after reconnecting
+        if self.writer is None:
+            return
+
+        guild_ids = [guild.id for guild in self.client.guilds if (guild.shard_id or 0) == shard_id]
+        self.writer.write(ipc_protocol.encode_shards(shard_id, self.client.shard_count or 1, guild_ids))
+
+    async def resolve_channel(self, channel_id: int):
+        """resolve a channel, refusing channels of guilds whose shard runs in another process"""
+        shard_ids = getattr(self.client, 'shard_ids', None)
+        if shard_ids is None:
+            return await self.resolver.channel(channel_id)
+
+        # the gateway caches every channel of the guilds on this process' shards, so a miss is another process'
+        # channel; only the process running shard 0 gets direct messages, it fetches what it does not know
+        channel = self.resolver.cached_channel(channel_id)
+        if channel is None:
+            if 0 not in shard_ids:
+                raise WrongShard(f'channel {channel_id} is not on shards {", ".join(map(str, shard_ids))}')
+            channel = await self.resolver.channel(channel_id)
+
+        if not isinstance(channel, discord.abc.GuildChannel):
+            return channel
+
+        # channels fetched for guilds of other processes only carry a discord.Object as their guild
+        if not isinstance(channel.guild, discord.Guild) or channel.guild.shard_id not in shard_ids:
+            raise WrongShard(f'channel {channel_id} is not on shards {", ".join(map(str, shard_ids))}')
+
+        return channel
+
+    def replay(self) -> None:
+        """send the replies buffered while the link was down"""
+        if self.outbox:
+            logger.info(f'replaying {len(self.outbox)} buffered replies '
+                        f'({self.dropped_replies} dropped because the buffer was full)')
+
+        while self.outbox:
+            self.writer.write(self.outbox.popleft())
+
+        self.dropped_replies = 0
+
+    async def flush(self) -> None:
+        """wait until the written frames left the buffer; a dead link is handled by the reader"""
+        if self.writer is None:
+            return
+
+        try:
+            await self.writer.drain()
+        except ConnectionError:
+            pass
+
+    async def receive_and_handle(self) -> bool:
+        """read frames and hand the commands to the dispatcher, replying ACK or BUSY right away
+
+        returns True if the main bot asked to shut down
+        """
         while True:
-            message = self.connection.recv()
-            message.strip()
-            message_part_list = message.split(' ')
+            frame = await self.recv()
+            opcode = OPCODE_NAMES.get(frame.opcode) or str(frame.opcode)
+            self.frames_received.inc((opcode,))
+
+            if frame.opcode == Opcode.SHUTDOWN:
+                await self.drain()
+                return True
+
+            if frame.opcode == Opcode.PING:
+                self.reply(Opcode.PONG, frame.request_id)
+            elif frame.opcode == Opcode.PONG:
+                pass
+            elif frame.opcode not in self.dispatcher:
+                logger.warning(f'ignoring frame with unknown opcode {frame.opcode}')
+                self.reply(Opcode.NACK, frame.request_id, frame.target, f'unknown opcode {frame.opcode}')
+                self.frames_processed.inc((opcode, 'unknown'))
+            elif self.dispatcher.submit(frame):
+                # the frame stays alive until it is reported, so its id is unique meanwhile
+                self.received[id(frame)] = (frame, time.perf_counter())
+                self.reply(Opcode.ACK, frame.request_id, frame.target)
+            else:
+                self.reply(Opcode.BUSY, frame.request_id, frame.target)
+                self.frames_processed.inc((opcode, 'busy'))
+                self.client.event_store.record_command(frame.request_id, frame.opcode, frame.target, 'busy')
+
+            # only wait for the socket once all frames of the last read are handled
+            if not self.pending_frames:
+                await self.flush()
+
+    async def report(self, frame: ipc_protocol.Frame, message, error: Exception) -> None:
+        """tell the main bot how a command ended"""
+        received = self.received.pop(id(frame), None)
+        # already reported as cancelled by drain()
+        if received is None:
+            return
+
+        opcode = OPCODE_NAMES.get(frame.opcode) or str(frame.opcode)
+        self.command_latency.observe(time.perf_counter() - received[1], (opcode,))
+        status = 'ok' if error is None else 'wrong_shard' if isinstance(error, WrongShard) else 'error'
+        self.frames_processed.inc((opcode, status))
+
+        if isinstance(error, WrongShard):
+            # not a failure, the main bot sends the command to the process owning the channel
+            logger.warning(f'request {frame.request_id} is meant for another shard: "{error}"')
+            self.reply(Opcode.WRONG_SHARD, frame.request_id, frame.target, str(error))
+            self.client.event_store.record_command(frame.request_id, frame.opcode, frame.target, 'wrong_shard')
+        elif error is not None:
+            logger.error(f'failed handling request {frame.request_id}: "{error}"')
+            self.reply(Opcode.NACK, frame.request_id, frame.target, f'{type(error).__name__}: {error}')
+            self.client.event_store.record_command(frame.request_id, frame.opcode, frame.target, 'error',
+                                                   error=f'{type(error).__name__}: {error}')
+        elif isinstance(message, str):
+            # profiling commands report the file they wrote
+            self.reply(Opcode.RESULT, frame.request_id, 0, message)
+            self.client.event_store.record_command(frame.request_id, frame.opcode, frame.target, 'ok')
+        else:
+            # commands sending several messages report the last one
+            if isinstance(message, list):
+                message = message[-1] if message else None
+
+            message_id = message.id if message is not None else 0
+            self.reply(Opcode.RESULT, frame.request_id, message_id)
+            self.client.event_store.record_command(frame.request_id, frame.opcode, frame.target, 'ok', message_id)
+
+        await self.flush()
+
+    async def drain(self) -> None:
+        """finish the accepted commands within SHUTDOWN_TIMEOUT, then close the link and the gateway"""
+        self.draining = True
+        deadline = time.monotonic() + shutdownTimeout
+        accepted = len(self.received)
+        logger.info(f'shutting down, draining {accepted} accepted commands...')
+
+        # commands that arrived together with SHUTDOWN are not accepted anymore
+        while self.pending_frames:
+            frame = self.pending_frames.pop()
+            if frame.opcode in self.dispatcher:
+                self.reply(Opcode.BUSY, frame.request_id, frame.target)
+        await self.flush()
+
+        # the commands, then messages of extensions queued in the send scheduler
+        try:
+            await asyncio.wait_for(self.dispatcher.join(), shutdownTimeout)
+            await asyncio.wait_for(self.client.send_scheduler.join(), max(0.0, deadline - time.monotonic()))
+        except asyncio.TimeoutError:
+            logger.warning(f'shutdown timeout of {shutdownTimeout}s reached, cancelling {len(self.received)} '
+                           f'commands and {self.client.send_scheduler.stats()["queued"]} queued messages')
+
+        # whatever is left is NACKed, so the main bot knows which commands to run elsewhere
+        cancelled = len(self.received)
+        for frame, _ in list(self.received.values()):
+            await self.report(frame, None, asyncio.CancelledError('the subbot shut down before running it'))
+        self.dispatcher.cancel()
+        self.client.send_scheduler.cancel()
+
+        if self.writer is not None:
+            self.writer.write(ipc_protocol.encode_status(accepted - cancelled, cancelled))
+            await self.flush()
+        logger.info(f'drained: {accepted - cancelled} commands finished, {cancelled} cancelled')
+
+        # the event store gets what is left of the timeout, at least a second
+        await self.client.loop.run_in_executor(None, self.client.event_store.close,
+                                               max(1.0, deadline - time.monotonic()))
 
-            if message == 'shutdown':
-                logger.info('shutting down...')
-                await self.client.close()
+        # closing unloads this extension, whose teardown cancels the task running drain()
+        self.client.loop.create_task(self.client.close())
 
-            if message_part_list[2] == 'repeat':
-                channel_id = int(message_part_list[0])
-                channel = await self.client.fetch_channel(channel_id)
+    # commands
+    # messages are queued in the send scheduler, which keeps them in order per channel;
+    # the returned futures are reported by the dispatcher once they are sent
+    async def repeat(self, frame: ipc_protocol.Frame):
+        channel = await self.resolve_channel(frame.target)
 
-                repeat_message = ' '.join(message_part_list[3:])
+        repeat_message = ipc_protocol.decode_text(frame.payload)
 
-                await channel.send(repeat_message)
+        return self.client.send_scheduler.submit(channel, repeat_message, coalesce=True)
 
-            if message_part_list[2] == 'spamchannel':
-                channel_id = int(message_part_list[0])
-                channel = await self.client.fetch_channel(channel_id)
+    async def spam_channel(self, frame: ipc_protocol.Frame):
+        channel = await self.resolve_channel(frame.target)
 
-                spam_amount = int(message_part_list[3])
-                spam_message = ' '.join(message_part_list[4:])
+        spam_amount, spam_message = ipc_protocol.decode_spam(frame.payload)
 
-                for i in range(spam_amount):
-                    await channel.send(spam_message)
+        return await self.spam(channel, spam_amount, spam_message)
 
-            if message_part_list[2] == 'spamuser':
-                user_id = int(message_part_list[3])
-                user = await self.client.fetch_user(user_id)
+    async def spam_user(self, frame: ipc_protocol.Frame):
+        user = await self.resolver.user(frame.target)
 
-                spam_amount = int(message_part_list[4])
-                spam_message = ' '.join(message_part_list[5:])
+        spam_amount, spam_message = ipc_protocol.decode_spam(frame.payload)
 
-                for i in range(spam_amount):
-                    await user.send(spam_message)
+        return await self.spam(user, spam_amount, spam_message)
+
+    async def spam(self, destination, spam_amount: int, spam_message: str):
+        """queue the messages in batches, so the send scheduler never holds more than a batch of them
+
+        the target's worker waits for every batch but the last, which keeps later commands behind this one
+        """
+        if spam_amount > spamMaxAmount:
+            raise ValueError(f'spam amount {spam_amount} is above the limit of {spamMaxAmount}')
+
+        for start in range(0, spam_amount, SPAM_BATCH_SIZE):
+            batch = asyncio.gather(*[self.client.send_scheduler.submit(destination, spam_message)
+                                     for i in range(min(SPAM_BATCH_SIZE, spam_amount - start))])
+            if start + SPAM_BATCH_SIZE >= spam_amount:
+                return batch
+
+            await batch
+
+        # nothing to send
+        return []
+
+    # profiling, see runtime_profiler
+    async def profile_start(self, frame: ipc_protocol.Frame):
+        seconds, kind = ipc_protocol.decode_profile(frame.payload)
+
+        if not seconds:
+            self.client.profiler.start(kind)
+            return None
+
+        # a window is reported once it is over, without holding up the queue
+        async def profile_window():
+            return (await self.client.profiler.run_for(kind, seconds)).path
+
+        return asyncio.ensure_future(profile_window())
+
+    async def profile_stop(self, frame: ipc_protocol.Frame):
+        seconds, kind = ipc_protocol.decode_profile(frame.payload)
+
+        return (await self.client.profiler.stop(kind)).path
 
 
 # extension
@@ -71,6 +473,12 @@ class OnReadyListener(commands.Cog, name='On Ready Listener', description='conta
     """cog for on_ready event"""
     def __init__(self, client):
         self.client = client
+        self.communication = None
+        self.communication_task = None
+
+    def cog_unload(self):
+        """hand the link to the main bot over to teardown(), which keeps it for a reload or stops it"""
+        self.client.extension_state[__name__] = (self.communication, self.communication_task)
 
     @commands.Cog.listener()
     async def on_ready(self):
@@ -85,26 +493,51 @@ class OnReadyListener(commands.Cog, name='On Ready Listener', description='conta
                      'The Bot is now up and running!'
                      '\n------')
 
-        # connect to main bot and wait for commands
-        logger.info('connecting to main bot...')
+        # on_ready fires again after gateway reconnects; keep the running link
+        if self.communication_task is not None and not self.communication_task.done():
+            return
 
-        communication = BotCommunication(self.client)
-        if communication.authenticate():
-            logger.info('Connection to main bot established!')
-            await communication.receive_and_handle()
-        else:
-            logger.info('Could not connect to main bot.')
-            logger.info('shutting down...')
-            await self.client.close()
+        # connect to main bot and wait for commands in the background
+        self.communication = BotCommunication(self.client)
+        self.communication_task = self.client.loop.create_task(self.communication.run())
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild):
+        """commands for the new guild can be routed here"""
+        if self.communication is not None:
+            self.communication.register_shard(guild.shard_id or 0)
+            await self.communication.flush()
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild):
+        """commands for the guild cannot be sent from here anymore"""
+        if self.communication is not None:
+            self.communication.register_shard(guild.shard_id or 0)
+            await self.communication.flush()
 
 
 # cog related functions
 def setup(client):
     """load extensions"""
     logger.info(f'loading extension: {os.path.basename(__file__)}')
-    client.add_cog(OnReadyListener(client))
+    cog = OnReadyListener(client)
+
+    # take over the running link to the main bot when being reloaded
+    state = client.extension_state.pop(__name__, None)
+    if state is not None:
+        cog.communication, cog.communication_task = state
+
+    client.add_cog(cog)
 
 
 def teardown(client):
     """send information when extension is being unloaded"""
     logger.info(f'unloading extension: {os.path.basename(__file__)}')
+
+    def stop_communication():
+        # still there if no reloaded version picked it up in setup()
+        state = client.extension_state.pop(__name__, None)
+        if state is not None and state[1] is not None:
+            state[1].cancel()
+
+    client.loop.call_soon(stop_communication)
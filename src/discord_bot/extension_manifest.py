@@ -0,0 +1,190 @@
+# imports
+import ast
+import sys
+import json
+import logging
+import importlib
+import pathlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# manifest
+"""
+the manifest (ext/manifest.json, tracked) lists every extension with its loading options:
+    name      dotted module path, e.g. ext.listeners.lis_-_on_ready
+    lazy      load the extension on first use of one of its commands instead of at startup
+    commands  command names that trigger loading a lazy extension
+it is generated from scanning the extension directory; entries of files that still exist keep their options,
+so these can be edited by hand. the manifest is only written when extensions were added or removed.
+
+the cache (ext/.manifest_cache.json, not tracked) holds what is generated from the files of the extensions:
+    preload   third party modules the extension imports, imported ahead of time in a thread pool
+    mtime     modification time of the file when preload was generated
+an extension is parsed again whenever its file changed
+"""
+MANIFEST_FILE_NAME = 'manifest.json'
+CACHE_FILE_NAME = '.manifest_cache.json'
+
+# modules every extension imports and that are loaded anyway before extensions
+ALREADY_LOADED = {'os', 'sys', 'logging', 'discord', 'dotenv', 'datetime'}
+# the standard library is cheap to import or loaded already (sys.stdlib_module_names needs python 3.10)
+STDLIB_MODULES = set(getattr(sys, 'stdlib_module_names', ())) | set(sys.builtin_module_names)
+
+
+def module_name(path: pathlib.Path, root: pathlib.Path) -> str:
+    """dotted module name of a python file, relative to the directory containing the extension directory"""
+    return '.'.join(path.relative_to(root.parent).with_suffix('').parts)
+
+
+def imported_modules(path: pathlib.Path) -> List[str]:
+    """top level modules a file imports, without the standard library, the ones everything imports and local modules"""
+    try:
+        tree = ast.parse(path.read_text(encoding='utf-8'), filename=str(path))
+    except (OSError, SyntaxError) as error:
+        logger.warning(f'could not read imports of {path}: "{error}"')
+        return []
+
+    modules = set()
+    for node in tree.body:
+        if isinstance(node, ast.Import):
+            modules.update(alias.name.split('.')[0] for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            modules.add(node.module.split('.')[0])
+
+    # modules next to the bot script (e.g. ipc_protocol) are cheap, leave them to the extension itself
+    return sorted(module for module in modules - ALREADY_LOADED - STDLIB_MODULES
+                  if not pathlib.Path(f'{module}.py').exists())
+
+
+def scan(ext_dir: str = './ext') -> List[pathlib.Path]:
+    """every python file in the extension directory"""
+    return [path for path in sorted(pathlib.Path(ext_dir).rglob('*.py')) if not path.name.startswith('__')]
+
+
+def new_options(name: str) -> Dict:
+    """manifest entry of a new extension, with default options"""
+    return {'name': name,
+            'lazy': False,
+            'commands': []}
+
+
+def new_cache_entry(path: pathlib.Path) -> Dict:
+    """cache entry of an extension, scanned from its file"""
+    return {'preload': imported_modules(path),
+            'mtime': path.stat().st_mtime}
+
+
+def read_json(path: pathlib.Path, description: str, default):
+    if not path.exists():
+        return default
+
+    try:
+        return json.loads(path.read_text())
+    except (OSError, ValueError) as error:
+        logger.warning(f'ignoring invalid {description}: "{error}"')
+        return default
+
+
+def load(ext_dir: str = './ext') -> List[Dict]:
+    """read manifest and cache, bring them up to date with the extension directory and write back what changed
+
+    returns an entry per extension with the options of the manifest and the preload of the cache
+    """
+    root = pathlib.Path(ext_dir)
+    manifest_path = root / MANIFEST_FILE_NAME
+    cache_path = root / CACHE_FILE_NAME
+
+    try:
+        manifest = {entry['name']: entry for entry in read_json(manifest_path, 'extension manifest',
+                                                                {'extensions': []})['extensions']}
+    except (KeyError, TypeError) as error:
+        logger.warning(f'ignoring invalid extension manifest: "{error}"')
+        manifest = {}
+    cache = read_json(cache_path, 'extension manifest cache', {})
+
+    options, new_cache = [], {}
+    for path in scan(ext_dir):
+        name = module_name(path, root)
+        # known extensions keep their hand edited options
+        options.append(manifest.get(name) or new_options(name))
+
+        # only new and changed files are parsed
+        cache_entry = cache.get(name)
+        if cache_entry is None or cache_entry.get('mtime') != path.stat().st_mtime:
+            cache_entry = new_cache_entry(path)
+        new_cache[name] = cache_entry
+
+    if options != list(manifest.values()):
+        logger.info(f'writing extension manifest {manifest_path}')
+        manifest_path.write_text(json.dumps({'extensions': options}, indent=4) + '\n')
+
+    if new_cache != cache:
+        try:
+            cache_path.write_text(json.dumps(new_cache, indent=4) + '\n')
+        except OSError as error:
+            logger.warning(f'could not write extension manifest cache {cache_path}: "{error}"')
+
+    return [dict(entry, preload=new_cache[entry['name']]['preload']) for entry in options]
+
+
+def preload(entries: List[Dict], max_workers: int = 4) -> None:
+    """import the modules extensions depend on in a thread pool, so loading the extensions finds them in sys.modules"""
+    modules = sorted({module for entry in entries for module in entry.get('preload', [])} - set(sys.modules))
+    if not modules:
+        return
+
+    def import_module(name: str) -> None:
+        try:
+            importlib.import_module(name)
+        except ImportError as error:
+            logger.warning(f'could not preload module {name}: "{error}"')
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(modules)), thread_name_prefix='preload') as executor:
+        list(executor.map(import_module, modules))
+
+
+# lazy loading
+class LazyExtensionLoader:
+    """loads lazy extensions the first time one of their commands is invoked
+
+    the invoked command is read with the prefix matcher, without building a context process_commands builds again
+    """
+    def __init__(self, client, entries: List[Dict], prefix_matcher):
+        self.client = client
+        self.prefix_matcher = prefix_matcher
+        # command name: extension
+        self.commands: Dict[str, str] = {}
+
+        for entry in entries:
+            if entry.get('lazy'):
+                for command in entry.get('commands', []):
+                    self.commands[command.lower()] = entry['name']
+
+    async def prepare(self, message) -> None:
+        """load the extension providing the command the message invokes, if it is not loaded yet"""
+        if not self.commands:
+            return
+
+        invoked_name = self.prefix_matcher.invoked_name(self.client, message)
+        if invoked_name is None:
+            return
+
+        name = self.commands.get(invoked_name.lower())
+        if name is None or name in self.client.extensions:
+            return
+
+        logger.info(f'loading lazy extension {name} for command {invoked_name}')
+        try:
+            self.client.load_extension(name)
+        except Exception as error:
+            logger.critical(f'failed loading extension {name}')
+            logger.error(f'error: "{error}"')
+        else:
+            # the extension is loaded for good, nothing to check for its commands anymore
+            self.commands = {command: extension for command, extension in self.commands.items() if extension != name}
@@ -0,0 +1,67 @@
+# imports
+import time
+import asyncio
+import logging
+import pathlib
+from typing import Dict
+
+import extension_manifest
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# watcher
+class ExtensionWatcher:
+    """reloads extensions whose file changed, without restarting the gateway session
+
+    files are polled by modification time. a changed extension is reloaded with client.reload_extension,
+    which puts the previously loaded version back if loading the new one fails.
+    extensions can hand state to their reloaded version through client.extension_state,
+    see teardown() / setup() of the listeners
+    """
+    def __init__(self, client, ext_dir: str = './ext', interval: float = 1.0):
+        self.client = client
+        self.ext_dir = ext_dir
+        self.interval = interval
+        # extension name: modification time it was loaded with
+        self.mtimes: Dict[str, float] = {}
+
+    def snapshot(self) -> Dict[str, float]:
+        """modification times of all extension files"""
+        mtimes = {}
+        for path in extension_manifest.scan(self.ext_dir):
+            try:
+                mtimes[extension_manifest.module_name(path, pathlib.Path(self.ext_dir))] = path.stat().st_mtime
+            except FileNotFoundError:
+                pass
+
+        return mtimes
+
+    async def run(self) -> None:
+        self.mtimes = self.snapshot()
+        logger.info(f'watching {len(self.mtimes)} extensions for changes')
+
+        while True:
+            await asyncio.sleep(self.interval)
+
+            for name, mtime in self.snapshot().items():
+                if self.mtimes.get(name) == mtime:
+                    continue
+
+                self.mtimes[name] = mtime
+                # lazy extensions that were not used yet are loaded in their new version anyway
+                if name in self.client.extensions:
+                    self.reload(name)
+
+    def reload(self, name: str) -> None:
+        start = time.perf_counter()
+        try:
+            self.client.reload_extension(name)
+        except Exception as error:
+            logger.critical(f'failed reloading extension {name}, keeping the previous version')
+            logger.error(f'error: "{error}"')
+        else:
+            logger.info(f'reloaded extension {name} in {(time.perf_counter() - start) * 1000:.1f}ms')
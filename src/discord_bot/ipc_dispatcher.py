@@ -0,0 +1,139 @@
+# imports
+import asyncio
+import logging
+import functools
+from typing import Awaitable, Callable, Dict
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# dispatcher
+class CommandDispatcher:
+    """runs commands from the main bot concurrently across targets, in order within one target
+
+    every target (channel or user id) gets its own bounded FIFO queue and a worker task that lives as long as
+    the queue has work, so a slow channel only holds up commands for that channel.
+    a handler may return a future instead of a result (e.g. a message queued in the SendScheduler, which keeps
+    the order itself); the worker then moves on and the command is reported once the future is done.
+    a command counts against its target from submit() until it is reported, futures included, and submit() refuses
+    work once the target or the global limit is reached instead of buffering without bound
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop,
+                 on_done: Callable[..., Awaitable[None]],
+                 max_pending: int = 1024,
+                 max_pending_per_target: int = 64):
+        self.loop = loop
+        # called as on_done(frame, result, error) after every command
+        self.on_done = on_done
+        self.max_pending = max_pending
+        self.max_pending_per_target = max_pending_per_target
+
+        self.handlers: Dict[int, Callable] = {}
+        self.queues: Dict[int, asyncio.Queue] = {}
+        self.workers: Dict[int, asyncio.Task] = {}
+        self.pending = 0
+        # target: commands queued, running or waiting for their future
+        self.pending_per_target: Dict[int, int] = {}
+        # set while no command is queued, running or being reported
+        self.idle = asyncio.Event()
+        self.idle.set()
+
+    def register(self, opcode: int, handler: Callable) -> None:
+        """register the coroutine function handling frames with this opcode"""
+        self.handlers[opcode] = handler
+
+    def __contains__(self, opcode: int) -> bool:
+        return opcode in self.handlers
+
+    def submit(self, frame) -> bool:
+        """queue a frame for its target, returns False if the queues are full"""
+        if self.pending >= self.max_pending:
+            return False
+
+        pending_for_target = self.pending_per_target.get(frame.target, 0)
+        if pending_for_target >= self.max_pending_per_target:
+            return False
+
+        queue = self.queues.get(frame.target)
+        if queue is None:
+            # bounded by pending_per_target
+            queue = self.queues[frame.target] = asyncio.Queue()
+
+        queue.put_nowait(frame)
+
+        self.pending += 1
+        self.pending_per_target[frame.target] = pending_for_target + 1
+        self.idle.clear()
+        if frame.target not in self.workers:
+            self.workers[frame.target] = self.loop.create_task(self.work(frame.target, queue))
+
+        return True
+
+    async def work(self, target: int, queue: asyncio.Queue) -> None:
+        """run the commands of one target one after another, stop once its queue is empty"""
+        try:
+            while not queue.empty():
+                frame = queue.get_nowait()
+
+                try:
+                    result = await self.handlers[frame.opcode](frame)
+                except asyncio.CancelledError:
+                    self.release(target, 1)
+                    raise
+                except Exception as error:
+                    await self.finish(frame, None, error)
+                    continue
+
+                if isinstance(result, asyncio.Future):
+                    result.add_done_callback(functools.partial(self.finish_later, frame))
+                else:
+                    await self.finish(frame, result, None)
+        finally:
+            # commands still queued when the worker is cancelled are dropped
+            self.release(target, queue.qsize())
+            del self.workers[target]
+            del self.queues[target]
+
+    async def finish(self, frame, result, error) -> None:
+        self.release(frame.target, 1, idle=False)
+        try:
+            await self.on_done(frame, result, error)
+        finally:
+            # join() returns once the last command was reported, not just finished
+            if not self.pending:
+                self.idle.set()
+
+    def release(self, target: int, count: int, idle: bool = True) -> None:
+        """forget finished or dropped commands of the target, idle=False leaves setting idle to the caller"""
+        if not count:
+            return
+
+        self.pending -= count
+        self.pending_per_target[target] -= count
+        if not self.pending_per_target[target]:
+            del self.pending_per_target[target]
+
+        if idle and not self.pending:
+            self.idle.set()
+
+    def finish_later(self, frame, future: asyncio.Future) -> None:
+        if future.cancelled():
+            error, result = asyncio.CancelledError('command was cancelled'), None
+        else:
+            error, result = future.exception(), None
+            if error is None:
+                result = future.result()
+
+        self.loop.create_task(self.finish(frame, result, error))
+
+    async def join(self) -> None:
+        """wait until every accepted command was reported"""
+        await self.idle.wait()
+
+    def cancel(self) -> None:
+        """drop all queued commands and stop the workers"""
+        for worker in list(self.workers.values()):
+            worker.cancel()
@@ -0,0 +1,195 @@
+# imports
+import enum
+import struct
+from typing import List, NamedTuple, Tuple
+
+
+# protocol
+"""
+length prefixed binary frames for the link between main bot and subbot
+
+every frame starts with a fixed header (network byte order):
+    version     (unsigned char)
+    opcode      (unsigned char)
+    request id  (unsigned int)        chosen by the main bot, replies carry the id of their request
+    target      (unsigned long long)  channel or user id the command is meant for, 0 if unused
+    length      (unsigned int)        number of payload bytes following the header
+
+this module does not import discord, the main bot can import it to encode its commands
+"""
+PROTOCOL_VERSION = 2
+HEADER = struct.Struct('!BBIQI')
+HEADER_SIZE = HEADER.size
+MAX_PAYLOAD_SIZE = 1024 * 1024
+
+SPAM_HEADER = struct.Struct('!I')
+SHARD_HEADER = struct.Struct('!I')
+STATUS_PAYLOAD = struct.Struct('!II')
+
+
+class Opcode(enum.IntEnum):
+    """all commands and replies that can be sent over the link"""
+    # handshake, target is the user id of the subbot
+    AUTH = 1
+    AUTH_OK = 2
+    AUTH_FAIL = 3
+
+    # control
+    SHUTDOWN = 4
+    PING = 5        # keepalive, either side answers with PONG
+    PONG = 6
+    STATUS = 7      # last frame of the subbot after SHUTDOWN, once it drained: how many of the commands in flight
+                    # at SHUTDOWN finished and how many were cancelled (NACKed) at the timeout (see encode_status)
+
+    # sharding, sent by the subbot after AUTH and whenever the guilds of a shard change:
+    # target is the shard id, the payload the shard count and the ids of all guilds of the shard (see encode_shards)
+    SHARD_REGISTER = 8
+
+    # commands, target is a channel id (user id for SPAM_USER)
+    REPEAT = 16
+    SPAM_CHANNEL = 17
+    SPAM_USER = 18
+
+    # profiling, the payload is a window in seconds (0 = until PROFILE_STOP) and the kind of session
+    # (cprofile, sampling, tracemalloc); see encode_profile
+    PROFILE_START = 24
+    PROFILE_STOP = 25
+
+    # replies of the subbot to a command, sent in completion order
+    ACK = 32        # command was accepted
+    RESULT = 33     # command succeeded, target is the id of the (last) discord message sent;
+                    # for profiling commands the payload is the path of the written file
+    NACK = 34       # command failed, payload is the error as utf-8 text
+    BUSY = 35       # command was refused because the subbot's queues are full, retry later
+    WRONG_SHARD = 36    # the target belongs to a guild of a shard this subbot process does not run
+
+
+class ProtocolError(Exception):
+    """raised when the peer sends something that is not a valid frame"""
+    pass
+
+
+class Frame(NamedTuple):
+    """one decoded frame; payload is a memoryview into the received data"""
+    version: int
+    opcode: int
+    request_id: int
+    target: int
+    payload: memoryview
+
+
+# encoding
+def encode_frame(opcode: int, target: int = 0, payload: bytes = b'', request_id: int = 0) -> bytes:
+    """build a frame for sending"""
+    if len(payload) > MAX_PAYLOAD_SIZE:
+        raise ProtocolError(f'payload of {len(payload)} bytes exceeds {MAX_PAYLOAD_SIZE} bytes')
+
+    return HEADER.pack(PROTOCOL_VERSION, opcode, request_id, target, len(payload)) + payload
+
+
+def encode_text(opcode: int, target: int, text: str, request_id: int = 0) -> bytes:
+    """build a frame carrying utf-8 text, e.g. REPEAT or NACK"""
+    return encode_frame(opcode, target, text.encode('utf-8'), request_id)
+
+
+def encode_spam(opcode: int, target: int, amount: int, text: str, request_id: int = 0) -> bytes:
+    """build a SPAM_CHANNEL / SPAM_USER frame"""
+    return encode_frame(opcode, target, SPAM_HEADER.pack(amount) + text.encode('utf-8'), request_id)
+
+
+def encode_profile(opcode: int, kind: str, seconds: int = 0, request_id: int = 0) -> bytes:
+    """build a PROFILE_START / PROFILE_STOP frame, laid out like a SPAM frame"""
+    return encode_spam(opcode, 0, seconds, kind, request_id)
+
+
+def encode_shards(shard_id: int, shard_count: int, guild_ids: List[int], request_id: int = 0) -> bytes:
+    """build a SHARD_REGISTER frame"""
+    payload = SHARD_HEADER.pack(shard_count) + struct.pack(f'!{len(guild_ids)}Q', *guild_ids)
+    return encode_frame(Opcode.SHARD_REGISTER, shard_id, payload, request_id)
+
+
+def encode_status(finished: int, cancelled: int) -> bytes:
+    """build the STATUS frame sent after draining"""
+    return encode_frame(Opcode.STATUS, 0, STATUS_PAYLOAD.pack(finished, cancelled))
+
+
+# decoding
+def decode_text(payload: memoryview) -> str:
+    """read the payload of a text frame"""
+    return str(payload, 'utf-8')
+
+
+def decode_spam(payload: memoryview) -> Tuple[int, str]:
+    """read the payload of a SPAM_CHANNEL / SPAM_USER frame as (amount, text)"""
+    if len(payload) < SPAM_HEADER.size:
+        raise ProtocolError('spam payload is too short')
+
+    amount, = SPAM_HEADER.unpack_from(payload)
+    return amount, str(payload[SPAM_HEADER.size:], 'utf-8')
+
+
+def decode_profile(payload: memoryview) -> Tuple[int, str]:
+    """read the payload of a PROFILE_START / PROFILE_STOP frame as (seconds, kind)"""
+    return decode_spam(payload)
+
+
+def decode_shards(payload: memoryview) -> Tuple[int, List[int]]:
+    """read the payload of a SHARD_REGISTER frame as (shard count, guild ids)"""
+    if len(payload) < SHARD_HEADER.size or (len(payload) - SHARD_HEADER.size) % 8:
+        raise ProtocolError('invalid shard payload')
+
+    shard_count, = SHARD_HEADER.unpack_from(payload)
+    guild_count = (len(payload) - SHARD_HEADER.size) // 8
+    return shard_count, list(struct.unpack_from(f'!{guild_count}Q', payload, SHARD_HEADER.size))
+
+
+def decode_status(payload: memoryview) -> Tuple[int, int]:
+    """read the payload of a STATUS frame as (finished, cancelled)"""
+    if len(payload) != STATUS_PAYLOAD.size:
+        raise ProtocolError('invalid status payload')
+
+    return STATUS_PAYLOAD.unpack(payload)
+
+
+class FrameDecoder:
+    """incremental decoder, feed it whatever the socket returned and get back all complete frames
+
+    partial frames are kept until the rest arrives. complete frames are parsed straight out of
+    the received bytes through a memoryview, payloads are not copied
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def feed(self, data: bytes) -> List[Frame]:
+        # only join with the remainder of the last read if there is one
+        if self.buffer:
+            self.buffer += data
+            data = bytes(self.buffer)
+            self.buffer.clear()
+
+        view = memoryview(data)
+        frames = []
+        offset = 0
+        end = len(view)
+
+        while end - offset >= HEADER_SIZE:
+            version, opcode, request_id, target, length = HEADER.unpack_from(view, offset)
+
+            if version != PROTOCOL_VERSION:
+                raise ProtocolError(f'unsupported protocol version {version}')
+            if length > MAX_PAYLOAD_SIZE:
+                raise ProtocolError(f'payload of {length} bytes exceeds {MAX_PAYLOAD_SIZE} bytes')
+
+            payload_start = offset + HEADER_SIZE
+            payload_end = payload_start + length
+            if payload_end > end:
+                break
+
+            frames.append(Frame(version, opcode, request_id, target, view[payload_start:payload_end]))
+            offset = payload_end
+
+        # keep the incomplete rest for the next read
+        if offset < end:
+            self.buffer += view[offset:]
+
+        return frames
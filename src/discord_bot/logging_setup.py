@@ -0,0 +1,81 @@
+# imports
+import os
+import gzip
+import json
+import queue
+import shutil
+import atexit
+import logging
+import logging.handlers
+
+
+# handlers
+class CompressingRotatorMixin:
+    """gzips log files when they are rotated out"""
+    def namer(self, default_name: str) -> str:
+        return default_name + '.gz'
+
+    def rotator(self, source: str, dest: str) -> None:
+        with open(source, 'rb') as source_file, gzip.open(dest, 'wb') as dest_file:
+            shutil.copyfileobj(source_file, dest_file)
+        os.remove(source)
+
+
+class CompressingRotatingFileHandler(CompressingRotatorMixin, logging.handlers.RotatingFileHandler):
+    """rotates once the file reaches maxBytes, keeps backupCount gzipped files"""
+    pass
+
+
+class CompressingTimedRotatingFileHandler(CompressingRotatorMixin, logging.handlers.TimedRotatingFileHandler):
+    """rotates every interval (e.g. at midnight), keeps backupCount gzipped files"""
+    pass
+
+
+# formatters
+class JsonFormatter(logging.Formatter):
+    """one json object per line"""
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {'time': self.formatTime(record),
+                 'level': record.levelname,
+                 'logger': record.name,
+                 'file': record.filename,
+                 'line': record.lineno,
+                 'message': record.getMessage()}
+
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+
+        return json.dumps(entry, ensure_ascii=False)
+
+
+# pipeline
+def start_queue_listener(logger: logging.Logger = None) -> logging.handlers.QueueListener:
+    """move the handlers of the logger (root by default) to a background thread
+
+    the logger only puts records into a queue; formatting and writing to stdout / files happens in the
+    listener thread, so logging never blocks the event loop on I/O
+    """
+    logger = logger or logging.getLogger()
+    handlers = list(logger.handlers)
+
+    log_queue = queue.SimpleQueue()
+    for handler in handlers:
+        logger.removeHandler(handler)
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+
+    listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+
+    # write everything still queued before the interpreter exits
+    atexit.register(stop_queue_listener, listener)
+
+    return listener
+
+
+def stop_queue_listener(listener: logging.handlers.QueueListener) -> None:
+    """flush the queue and stop the listener thread; safe to call more than once"""
+    if listener._thread is not None:
+        listener.stop()
+
+    for handler in listener.handlers:
+        handler.flush()
@@ -0,0 +1,278 @@
+# imports
+import math
+import time
+import bisect
+import asyncio
+import logging
+from typing import Callable, Dict, Iterable, List, Tuple
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# metric types
+"""latency buckets in seconds, from a fast IPC round trip to a request stuck behind a rate limit"""
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def format_value(value: float) -> str:
+    if value == math.inf:
+        return '+Inf'
+    if value != value:
+        return 'NaN'
+    if isinstance(value, int) and not isinstance(value, bool):
+        return str(value)
+    return repr(float(value))
+
+
+def format_labels(names: Tuple[str, ...], values: tuple) -> str:
+    if not names:
+        return ''
+
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for value in values)
+    return '{' + ','.join(f'{name}="{value}"' for name, value in zip(names, escaped)) + '}'
+
+
+class Metric:
+    """a metric family; values are keyed by a tuple of label values
+
+    instead of being updated on the hot path, a metric can read its values from collect() when scraped, which
+    returns a number or a dict of label values to numbers (used for counters the objects keep anyway)
+    """
+    type = 'untyped'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (), collect: Callable = None):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.collect = collect
+        self.values: Dict[tuple, float] = {}
+
+    def samples(self) -> Iterable[Tuple[str, tuple, tuple, float]]:
+        values = self.values
+        if self.collect is not None:
+            values = self.collect()
+            if not isinstance(values, dict):
+                values = {(): values}
+
+        for label_values, value in values.items():
+            yield self.name, self.labels, label_values, value
+
+    def render(self) -> List[str]:
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+        for name, label_names, label_values, value in self.samples():
+            lines.append(f'{name}{format_labels(label_names, label_values)} {format_value(value)}')
+        return lines
+
+
+class Counter(Metric):
+    type = 'counter'
+
+    def inc(self, labels: tuple = (), amount: float = 1) -> None:
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+
+class Gauge(Metric):
+    type = 'gauge'
+
+    def set(self, value: float, labels: tuple = ()) -> None:
+        self.values[labels] = value
+
+
+class Histogram(Metric):
+    type = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values: [count per bucket (the last one is +Inf), sum, count]
+        self.values: Dict[tuple, list] = {}
+
+    def observe(self, value: float, labels: tuple = ()) -> None:
+        series = self.values.get(labels)
+        if series is None:
+            series = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def samples(self) -> Iterable[Tuple[str, tuple, tuple, float]]:
+        bucket_labels = self.labels + ('le',)
+        for label_values, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+                cumulative += bucket_count
+                yield f'{self.name}_bucket', bucket_labels, label_values + (format_value(bound),), cumulative
+            yield f'{self.name}_sum', self.labels, label_values, total
+            yield f'{self.name}_count', self.labels, label_values, count
+
+
+# registry
+class MetricsRegistry:
+    """all metrics of the subbot, rendered in the prometheus text format
+
+    metrics are created through the registry and looked up by name if they exist already, so reloaded extensions
+    keep counting into the same series; a collect function given again replaces the previous one
+    """
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def get_or_create(self, cls, name: str, documentation: str, labels: Iterable[str], **kwargs) -> Metric:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics[name] = cls(name, documentation, labels, **kwargs)
+        elif not isinstance(metric, cls):
+            raise ValueError(f'metric {name} exists as {metric.type}')
+        elif 'collect' in kwargs:
+            metric.collect = kwargs['collect']
+
+        return metric
+
+    def counter(self, name: str, documentation: str, labels: Iterable[str] = (), collect: Callable = None) -> Counter:
+        if collect is None:
+            return self.get_or_create(Counter, name, documentation, labels)
+        return self.get_or_create(Counter, name, documentation, labels, collect=collect)
+
+    def gauge(self, name: str, documentation: str, labels: Iterable[str] = (), collect: Callable = None) -> Gauge:
+        if collect is None:
+            return self.get_or_create(Gauge, name, documentation, labels)
+        return self.get_or_create(Gauge, name, documentation, labels, collect=collect)
+
+    def histogram(self, name: str, documentation: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.get_or_create(Histogram, name, documentation, labels, buckets=buckets)
+
+    def unregister(self, name: str) -> None:
+        self.metrics.pop(name, None)
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            try:
+                lines.extend(metric.render())
+            except Exception as error:
+                logger.error(f'failed collecting metric {metric.name}: "{error!r}"')
+
+        return '\n'.join(lines) + '\n'
+
+
+# http listener
+class MetricsServer:
+    """minimal HTTP/1.0 listener answering GET /metrics, runs on the event loop of the bot"""
+    def __init__(self, registry: MetricsRegistry, host: str, port: int):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self.server = None
+
+    async def start(self) -> None:
+        try:
+            self.server = await asyncio.start_server(self.handle, self.host, self.port)
+        except OSError as error:
+            logger.error(f'could not serve metrics on {self.host}:{self.port}: "{error}"')
+            return
+
+        logger.info(f'serving metrics on http://{self.host}:{self.port}/metrics')
+
+    async def close(self) -> None:
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+            self.server = None
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            # the headers are not needed
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 5)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+
+            parts = request_line.split()
+            if len(parts) >= 2 and parts[0] == b'GET' and parts[1].split(b'?')[0] in (b'/', b'/metrics'):
+                status, body = '200 OK', self.registry.render().encode('utf-8')
+            else:
+                status, body = '404 Not Found', b'not found\n'
+
+            writer.write(f'HTTP/1.0 {status}\r\n'
+                         f'Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n'
+                         f'Content-Length: {len(body)}\r\n'
+                         f'Connection: close\r\n\r\n'.encode('ascii') + body)
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+
+# instrumentation
+class RateLimitFilter(logging.Filter):
+    """counts the 429s discord.py handles (and only logs) itself, per route; never drops a record"""
+    def __init__(self, counter: Counter):
+        super().__init__()
+        self.counter = counter
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if isinstance(record.msg, str) and record.msg.startswith('We are being rate limited'):
+            # buckets look like "channel_id:guild_id:/route/{template}"
+            bucket = str(record.args[1]) if record.args and len(record.args) > 1 else ''
+            self.counter.inc((bucket.split(':', 2)[-1],))
+        elif isinstance(record.msg, str) and record.msg.startswith('Global rate limit has been hit'):
+            self.counter.inc(('global',))
+
+        return True
+
+
+def instrument_http(http, registry: MetricsRegistry) -> None:
+    """count and time every REST call by method and route template, and count 429s per route"""
+    calls = registry.counter('subbot_rest_requests_total', 'REST calls by method, route and outcome',
+                             ('method', 'route', 'status'))
+    latency = registry.histogram('subbot_rest_request_seconds', 'REST call duration, including rate limit waits',
+                                 ('method', 'route'))
+    rate_limits = registry.counter('subbot_rest_rate_limited_total', '429 responses retried by discord.py',
+                                   ('route',))
+
+    request = http.request
+
+    async def instrumented_request(route, **kwargs):
+        start = time.perf_counter()
+        status = 'ok'
+        try:
+            return await request(route, **kwargs)
+        except Exception as error:
+            status = str(getattr(error, 'status', type(error).__name__))
+            raise
+        finally:
+            labels = (route.method, route.path)
+            latency.observe(time.perf_counter() - start, labels)
+            calls.inc(labels + (status,))
+
+    http.request = instrumented_request
+
+    # discord.py retries 429s internally, they only show up as warnings of its http logger
+    http_logger = logging.getLogger('discord.http')
+    for existing in [f for f in http_logger.filters if isinstance(f, RateLimitFilter)]:
+        http_logger.removeFilter(existing)
+    http_logger.addFilter(RateLimitFilter(rate_limits))
+
+
+async def watch_loop_lag(registry: MetricsRegistry, interval: float = 0.5) -> None:
+    """measure how late the event loop wakes up a sleeping task"""
+    lag_histogram = registry.histogram('subbot_event_loop_lag_seconds', 'delay of scheduled callbacks',
+                                       buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0))
+    lag_gauge = registry.gauge('subbot_event_loop_lag_last_seconds', 'delay of the last measured callback')
+
+    loop = asyncio.get_event_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - start - interval)
+
+        lag_histogram.observe(lag)
+        lag_gauge.set(lag)
+
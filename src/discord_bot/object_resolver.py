@@ -0,0 +1,112 @@
+# imports
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Dict
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# resolver
+class ObjectResolver:
+    """resolves channel and user ids to discord objects with as few REST calls as possible
+
+    lookup order:
+        1. the gateway cache (client.get_channel / client.get_user), a dict lookup
+        2. a bounded LRU of objects fetched before, entries expire after ttl seconds
+        3. client.fetch_channel / client.fetch_user; concurrent lookups of the same id share one request
+    """
+    def __init__(self, client, max_size: int = 1024, ttl: float = 300.0):
+        self.client = client
+        self.max_size = max_size
+        self.ttl = ttl
+
+        # (kind, id): (expiry time, object)
+        self.cache = OrderedDict()
+        # (kind, id): task fetching the object
+        self.in_flight: Dict[tuple, asyncio.Task] = {}
+
+        # counters
+        self.gateway_hits = 0
+        self.cache_hits = 0
+        self.misses = 0
+        self.shared_fetches = 0
+
+    async def channel(self, channel_id: int):
+        return await self.resolve('channel', channel_id, self.client.get_channel, self.client.fetch_channel)
+
+    async def user(self, user_id: int):
+        return await self.resolve('user', user_id, self.client.get_user, self.client.fetch_user)
+
+    def cached_channel(self, channel_id: int):
+        """the channel if it is known without a REST call, otherwise None"""
+        return self.lookup('channel', channel_id, self.client.get_channel)
+
+    async def resolve(self, kind: str, object_id: int, get, fetch):
+        obj = self.lookup(kind, object_id, get)
+        if obj is not None:
+            return obj
+
+        # REST, shared by everyone asking for the same id at the same time
+        key = (kind, object_id)
+        task = self.in_flight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self.in_flight[key] = asyncio.ensure_future(self.fetch(key, fetch))
+        else:
+            self.shared_fetches += 1
+
+        return await asyncio.shield(task)
+
+    def lookup(self, kind: str, object_id: int, get):
+        """steps 1 and 2 of the lookup order"""
+        # gateway cache
+        obj = get(object_id)
+        if obj is not None:
+            self.gateway_hits += 1
+            return obj
+
+        # fetched objects
+        key = (kind, object_id)
+        entry = self.cache.get(key)
+        if entry is not None:
+            expires, obj = entry
+            if expires > time.monotonic():
+                self.cache.move_to_end(key)
+                self.cache_hits += 1
+                return obj
+
+            del self.cache[key]
+
+        return None
+
+    async def fetch(self, key: tuple, fetch):
+        logger.debug(f'fetching {key[0]} {key[1]}')
+        try:
+            obj = await fetch(key[1])
+        finally:
+            del self.in_flight[key]
+
+        self.cache[key] = (time.monotonic() + self.ttl, obj)
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+
+        return obj
+
+    def invalidate(self, kind: str, object_id: int) -> None:
+        """forget a fetched object, e.g. after the channel was deleted"""
+        self.cache.pop((kind, object_id), None)
+
+    def stats(self) -> dict:
+        lookups = self.gateway_hits + self.cache_hits + self.misses + self.shared_fetches
+        return {'gateway_hits': self.gateway_hits,
+                'cache_hits': self.cache_hits,
+                'misses': self.misses,
+                'shared_fetches': self.shared_fetches,
+                'hit_rate': (self.gateway_hits + self.cache_hits) / lookups if lookups else 0.0,
+                'cached': len(self.cache)}
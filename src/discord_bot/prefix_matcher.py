@@ -0,0 +1,118 @@
+# imports
+import re
+import json
+import logging
+from typing import Dict, Iterable, List, Optional, Pattern, Tuple
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# matcher
+class PrefixMatcher:
+    """command prefixes of the bot: its mention plus configured prefixes, which can be overridden per guild
+
+    an instance is used as command_prefix of the bot (returning the same list as when_mentioned_or) and as a
+    pre-filter: matches() checks a message against one compiled regex per guild, so messages that are not
+    commands are dropped before discord.py resolves prefixes and builds a context
+    """
+    def __init__(self, default_prefixes: Iterable[str], guild_prefixes: Dict[int, List[str]] = None):
+        self.default_prefixes = tuple(default_prefixes)
+        self.guild_prefixes: Dict[int, Tuple[str, ...]] = {}
+
+        # guild id (None for direct messages and guilds without override): compiled prefix regex
+        self.patterns: Dict[Optional[int], Pattern] = {}
+        self.user_id = None
+
+        for guild_id, prefixes in (guild_prefixes or {}).items():
+            try:
+                self.set_guild_prefixes(guild_id, prefixes)
+            except ValueError as error:
+                logger.error(f'ignoring prefixes of guild {guild_id}: "{error}"')
+
+        # counters
+        self.filtered = 0
+        self.passed = 0
+
+    @classmethod
+    def from_file(cls, default_prefixes: Iterable[str], path: str) -> 'PrefixMatcher':
+        """guild prefixes from a json file mapping guild ids to lists of prefixes"""
+        guild_prefixes = {}
+        if path:
+            try:
+                with open(path, encoding='utf-8') as file:
+                    guild_prefixes = {int(guild_id): prefixes for guild_id, prefixes in json.load(file).items()}
+            except FileNotFoundError:
+                pass
+            except (OSError, ValueError) as error:
+                logger.error(f'could not read guild prefixes from {path}: "{error}"')
+
+        return cls(default_prefixes, guild_prefixes)
+
+    def prefixes_for(self, guild_id: Optional[int]) -> Tuple[str, ...]:
+        return self.guild_prefixes.get(guild_id, self.default_prefixes)
+
+    def set_guild_prefixes(self, guild_id: int, prefixes: Optional[Iterable[str]]) -> None:
+        """override the prefixes of a guild, None goes back to the default prefixes
+
+        raises ValueError for an empty list, the guild could only use the bot by mentioning it
+        """
+        if prefixes is None:
+            self.guild_prefixes.pop(guild_id, None)
+        else:
+            prefixes = tuple(prefix for prefix in prefixes if prefix)
+            if not prefixes:
+                raise ValueError('a guild needs at least one non-empty prefix, use None for the default prefixes')
+            self.guild_prefixes[guild_id] = prefixes
+
+        self.patterns.pop(guild_id, None)
+
+    def pattern_for(self, user_id: int, guild_id: Optional[int]) -> Pattern:
+        # the mention is part of every pattern, compile again if the bot user changed
+        if user_id != self.user_id:
+            self.user_id = user_id
+            self.patterns.clear()
+
+        key = guild_id if guild_id in self.guild_prefixes else None
+        pattern = self.patterns.get(key)
+        if pattern is None:
+            alternatives = [f'<@!?{user_id}> '] + [re.escape(prefix) for prefix in self.prefixes_for(key)]
+            pattern = self.patterns[key] = re.compile('|'.join(alternatives))
+
+        return pattern
+
+    def matches(self, bot, message) -> bool:
+        """does the message start with one of the bot's prefixes"""
+        guild_id = message.guild.id if message.guild is not None else None
+
+        if self.pattern_for(bot.user.id, guild_id).match(message.content):
+            self.passed += 1
+            return True
+
+        self.filtered += 1
+        return False
+
+    def invoked_name(self, bot, message) -> Optional[str]:
+        """first word after the prefix, i.e. the command the message invokes, None if it has no prefix"""
+        guild_id = message.guild.id if message.guild is not None else None
+
+        match = self.pattern_for(bot.user.id, guild_id).match(message.content)
+        if match is None:
+            return None
+
+        # the bot strips whitespace after the prefix
+        words = message.content[match.end():].split(maxsplit=1)
+        return words[0] if words else None
+
+    def display_prefix(self, bot, message) -> str:
+        """the prefix to show in responses: the first configured one, or the mention if there is none"""
+        guild_id = message.guild.id if message.guild is not None else None
+        prefixes = self.prefixes_for(guild_id)
+        return prefixes[0] if prefixes else f'<@{bot.user.id}> '
+
+    def __call__(self, bot, message) -> List[str]:
+        """command_prefix of the bot: mention forms first, then the configured prefixes"""
+        guild_id = message.guild.id if message.guild is not None else None
+        return [f'<@{bot.user.id}> ', f'<@!{bot.user.id}> ', *self.prefixes_for(guild_id)]
@@ -0,0 +1,78 @@
+# imports
+import asyncio
+import logging
+
+import discord.gateway
+import discord.http
+import discord.utils
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# runtime mode
+"""
+RUNTIME_MODE
+    default     the asyncio event loop and the json module of the standard library
+    fast        the uvloop event loop and orjson for the payloads of the gateway and the REST API; each is only used
+                if it is installed (pip install uvloop orjson), otherwise the standard library stays in place
+
+install() has to run before the client is created, discord.py takes the event loop from the policy in Client()
+"""
+MODES = ('default', 'fast')
+
+
+class OrjsonModule:
+    """stands in for the json module inside discord.gateway and discord.http, which only call json.loads"""
+    def __init__(self, orjson):
+        self.orjson = orjson
+
+    def loads(self, data, **kwargs):
+        # orjson takes str and bytes alike
+        return self.orjson.loads(data)
+
+    def dumps(self, obj, **kwargs) -> str:
+        return self.orjson.dumps(obj, option=self.orjson.OPT_NON_STR_KEYS).decode('utf-8')
+
+
+def install_event_loop() -> str:
+    """use uvloop for every event loop created from now on, returns the name of the loop in use"""
+    try:
+        import uvloop
+    except ImportError:
+        logger.warning('uvloop is not installed, staying on the asyncio event loop')
+        return 'asyncio'
+
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    # Client() asks asyncio.get_event_loop(), which the uvloop policy does not answer with a new loop
+    asyncio.set_event_loop(asyncio.new_event_loop())
+    return 'uvloop'
+
+
+def install_json_codec() -> str:
+    """decode gateway events and REST responses and encode outgoing payloads with orjson, returns the codec in use"""
+    try:
+        import orjson
+    except ImportError:
+        logger.warning('orjson is not installed, staying on the json module')
+        return 'json'
+
+    codec = OrjsonModule(orjson)
+    discord.gateway.json = codec
+    discord.http.json = codec
+    # outgoing payloads: gateway commands (heartbeats, presence) and REST bodies; utf-8 instead of ascii escapes
+    discord.utils.to_json = codec.dumps
+    return 'orjson'
+
+
+def install(mode: str) -> dict:
+    """set up the runtime of the given mode, returns what is in use, e.g. {'event_loop': 'uvloop', 'json': 'orjson'}"""
+    if mode not in MODES:
+        raise ValueError(f'unknown runtime mode "{mode}", use one of: {", ".join(MODES)}')
+
+    if mode == 'default':
+        return {'event_loop': 'asyncio', 'json': 'json'}
+
+    return {'event_loop': install_event_loop(), 'json': install_json_codec()}
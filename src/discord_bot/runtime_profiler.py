@@ -0,0 +1,249 @@
+# imports
+import io
+import os
+import sys
+import time
+import pstats
+import asyncio
+import logging
+import cProfile
+import threading
+import traceback
+import tracemalloc
+from collections import Counter
+from typing import Dict, NamedTuple, Optional
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# profiling
+"""
+on demand profiling of the running subbot, started and stopped through the profiling cog or the IPC link:
+    cprofile     deterministic profile of the event loop thread, written as .pstats (snakeviz, pstats, gprof2dot)
+    sampling     stack of the event loop thread sampled from another thread, written as collapsed stacks
+                 (.collapsed, for flamegraph.pl or speedscope); cheap enough to run under load
+    tracemalloc  allocations between start and stop, written as a diff of the top lines (.txt) and the snapshot
+"""
+KINDS = ('cprofile', 'sampling', 'tracemalloc')
+
+
+class ProfilingError(Exception):
+    """raised for unknown kinds and for starting / stopping a session in the wrong state"""
+    pass
+
+
+class ProfileResult(NamedTuple):
+    """the file a session was written to and a short text summary"""
+    path: str
+    summary: str
+
+
+class SamplingProfiler:
+    """samples the stack of one thread every interval seconds and counts identical stacks"""
+    def __init__(self, thread_id: int, interval: float = 0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.sample, name='sampling-profiler', daemon=True)
+
+    def start(self) -> None:
+        self.thread.start()
+
+    def stop(self) -> Counter:
+        self.stopping.set()
+        self.thread.join()
+        return self.stacks
+
+    def sample(self) -> None:
+        while not self.stopping.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+
+            if stack:
+                stack.reverse()
+                self.stacks[';'.join(stack)] += 1
+
+
+class RuntimeProfiler:
+    """at most one session per kind; sessions are started on the event loop thread, results are written in a thread"""
+    def __init__(self, output_dir: str = 'profiles', sample_interval: float = 0.005, tracemalloc_frames: int = 25):
+        self.output_dir = output_dir
+        self.sample_interval = sample_interval
+        self.tracemalloc_frames = tracemalloc_frames
+        # kind: running session (profile, sampler or (baseline snapshot, started tracing))
+        self.sessions: Dict[str, object] = {}
+
+    def path(self, kind: str, extension: str) -> str:
+        os.makedirs(self.output_dir, exist_ok=True)
+        return os.path.join(self.output_dir, f'{kind}-{time.strftime("%Y%m%d-%H%M%S")}.{extension}')
+
+    def start(self, kind: str) -> None:
+        if kind not in KINDS:
+            raise ProfilingError(f'unknown kind of profiling session "{kind}", use one of: {", ".join(KINDS)}')
+        if kind in self.sessions:
+            raise ProfilingError(f'a {kind} session is running already')
+
+        if kind == 'cprofile':
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as error:
+                # another profiler (e.g. a debugger) is active
+                raise ProfilingError(str(error)) from error
+            self.sessions[kind] = profile
+
+        elif kind == 'sampling':
+            sampler = SamplingProfiler(threading.get_ident(), self.sample_interval)
+            sampler.start()
+            self.sessions[kind] = sampler
+
+        else:
+            started = not tracemalloc.is_tracing()
+            if started:
+                tracemalloc.start(self.tracemalloc_frames)
+            self.sessions[kind] = (tracemalloc.take_snapshot(), started)
+
+        logger.info(f'started {kind} session')
+
+    async def stop(self, kind: str) -> ProfileResult:
+        if kind not in KINDS:
+            raise ProfilingError(f'unknown kind of profiling session "{kind}", use one of: {", ".join(KINDS)}')
+        session = self.sessions.pop(kind, None)
+        if session is None:
+            raise ProfilingError(f'no {kind} session is running')
+
+        loop = asyncio.get_event_loop()
+        if kind == 'cprofile':
+            session.disable()
+            result = await loop.run_in_executor(None, self.write_cprofile, session)
+        elif kind == 'sampling':
+            stacks = await loop.run_in_executor(None, session.stop)
+            result = await loop.run_in_executor(None, self.write_sampling, stacks)
+        else:
+            result = await loop.run_in_executor(None, self.write_tracemalloc, *session)
+
+        logger.info(f'stopped {kind} session, written to {result.path}')
+        return result
+
+    async def run_for(self, kind: str, seconds: float) -> ProfileResult:
+        """profile a window of the given length"""
+        self.start(kind)
+        await asyncio.sleep(seconds)
+        return await self.stop(kind)
+
+    def stop_all(self) -> None:
+        """end running sessions without writing them, e.g. when shutting down"""
+        for kind, session in list(self.sessions.items()):
+            if kind == 'cprofile':
+                session.disable()
+            elif kind == 'sampling':
+                session.stop()
+            elif session[1]:
+                tracemalloc.stop()
+        self.sessions.clear()
+
+    # writing, blocking
+    def write_cprofile(self, profile: cProfile.Profile) -> ProfileResult:
+        path = self.path('cprofile', 'pstats')
+        profile.dump_stats(path)
+
+        summary = io.StringIO()
+        pstats.Stats(profile, stream=summary).strip_dirs().sort_stats('cumulative').print_stats(15)
+        return ProfileResult(path, summary.getvalue())
+
+    def write_sampling(self, stacks: Counter) -> ProfileResult:
+        path = self.path('sampling', 'collapsed')
+        with open(path, 'w', encoding='utf-8') as file:
+            for stack, count in stacks.most_common():
+                file.write(f'{stack} {count}\n')
+
+        # the innermost frames seen most often
+        leaves = Counter()
+        for stack, count in stacks.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(stacks.values()) or 1
+        summary = '\n'.join(f'{count / total:6.1%} {leaf}' for leaf, count in leaves.most_common(15))
+
+        return ProfileResult(path, f'{total} samples\n{summary}')
+
+    def write_tracemalloc(self, baseline: tracemalloc.Snapshot, started: bool) -> ProfileResult:
+        snapshot = tracemalloc.take_snapshot()
+        if started:
+            tracemalloc.stop()
+
+        path = self.path('tracemalloc', 'txt')
+        snapshot.dump(f'{path[:-len(".txt")]}.snapshot')
+
+        differences = snapshot.compare_to(baseline, 'lineno')
+        with open(path, 'w', encoding='utf-8') as file:
+            for difference in differences[:100]:
+                file.write(f'{difference}\n')
+
+        summary = '\n'.join(str(difference) for difference in differences[:10])
+        return ProfileResult(path, summary)
+
+
+# stall detection
+class StallDetector:
+    """watchdog thread logging the stack of the event loop thread while a callback blocks the loop
+
+    the loop updates a heartbeat every threshold / 4 seconds; if the watchdog sees no heartbeat for longer than
+    threshold, it logs what the loop thread is running at that moment (once per stall)
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, threshold: float = 0.5):
+        self.loop = loop
+        self.threshold = threshold
+        self.interval = threshold / 4
+
+        self.thread_id: Optional[int] = None
+        self.last_beat = 0.0
+        self.stalled_since = None
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.watch, name='stall-detector', daemon=True)
+
+        # counters
+        self.stalls = 0
+
+    def start(self) -> None:
+        """start watching, call on the event loop thread"""
+        self.thread_id = threading.get_ident()
+        self.last_beat = time.monotonic()
+        self.loop.call_soon(self.beat)
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopping.set()
+
+    def beat(self) -> None:
+        now = time.monotonic()
+        stalled_since = self.stalled_since
+        if stalled_since is not None:
+            self.stalled_since = None
+            logger.warning(f'event loop was blocked for {(now - stalled_since - self.interval) * 1000:.0f}ms')
+
+        self.last_beat = now
+        if not self.stopping.is_set():
+            self.loop.call_later(self.interval, self.beat)
+
+    def watch(self) -> None:
+        while not self.stopping.wait(self.interval):
+            last_beat = self.last_beat
+            blocked = time.monotonic() - last_beat - self.interval
+            if blocked <= self.threshold or self.stalled_since == last_beat or self.loop.is_closed():
+                continue
+
+            self.stalled_since = last_beat
+            self.stalls += 1
+
+            frame = sys._current_frames().get(self.thread_id)
+            stack = ''.join(traceback.format_stack(frame)) if frame is not None else 'unknown\n'
+            logger.warning(f'event loop blocked for more than {blocked * 1000:.0f}ms, it is running:\n{stack}')
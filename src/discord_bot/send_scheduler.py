@@ -0,0 +1,214 @@
+# imports
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Dict
+
+import discord
+from discord.ext import commands
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# scheduler
+class SendScheduler:
+    """orders outgoing messages per channel and keeps each channel under its rate limit
+
+    every destination (channel, user, context) gets a FIFO queue and a worker task that lives as long as the queue
+    has work. the worker spends one token of the destination's bucket per API call and waits for the bucket to refill
+    instead of running into a 429. plain text queued with coalesce=True is joined with the plain text queued right
+    after it (as long as the result fits into one message), so a burst of short messages costs fewer API calls
+    """
+    def __init__(self, loop: asyncio.AbstractEventLoop, rate: int = 5, per: float = 5.0,
+                 max_length: int = 2000, max_retries: int = 3):
+        self.loop = loop
+        # discord allows 5 messages per 5 seconds per channel
+        self.rate = rate
+        self.per = per
+        self.max_length = max_length
+        self.max_retries = max_retries
+
+        self.queues: Dict[int, deque] = {}
+        self.workers: Dict[int, asyncio.Task] = {}
+        # destination id: send times of the current window
+        self.buckets: Dict[int, deque] = {}
+        # destination id: time until which discord asked us to wait
+        self.blocked_until: Dict[int, float] = {}
+        # destination id: timer dropping the rate limit state once the destination is idle
+        self.forget_timers: Dict[int, asyncio.TimerHandle] = {}
+
+        # counters
+        self.submitted = 0
+        self.api_calls = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+
+    def submit(self, destination, content=None, *, coalesce: bool = False, **kwargs) -> asyncio.Future:
+        """queue a message, the returned future resolves to the sent discord.Message"""
+        # contexts are queued by the channel they belong to
+        if isinstance(destination, commands.Context):
+            destination = destination.channel
+
+        future = self.loop.create_future()
+        key = destination.id
+        queue = self.queues.get(key)
+        if queue is None:
+            queue = self.queues[key] = deque()
+
+        # only plain text can be merged with other messages
+        coalesce = coalesce and not kwargs and content is not None
+        queue.append((content, kwargs, coalesce, future))
+        self.submitted += 1
+
+        if key not in self.workers:
+            # the bucket of the last worker is still in use
+            timer = self.forget_timers.pop(key, None)
+            if timer is not None:
+                timer.cancel()
+            self.workers[key] = self.loop.create_task(self.work(key, destination, queue))
+
+        return future
+
+    async def send(self, destination, content=None, **kwargs) -> discord.Message:
+        """queue a message and wait until it was sent"""
+        return await self.submit(destination, content, **kwargs)
+
+    def take(self, queue: deque) -> tuple:
+        """pop the next API call from the queue, merging coalescable plain text"""
+        content, kwargs, coalesce, future = queue.popleft()
+        futures = [future]
+
+        if coalesce:
+            parts = [str(content)]
+            length = len(parts[0])
+            while queue and queue[0][2] and length + 1 + len(str(queue[0][0])) <= self.max_length:
+                next_content, _, _, next_future = queue.popleft()
+                parts.append(str(next_content))
+                futures.append(next_future)
+                length += 1 + len(parts[-1])
+
+            content = '\n'.join(parts)
+            self.coalesced += len(futures) - 1
+
+        return content, kwargs, futures
+
+    async def acquire(self, key: int) -> None:
+        """wait until the destination's bucket has a token left"""
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = deque()
+
+        while True:
+            now = time.monotonic()
+
+            blocked_until = self.blocked_until.get(key, 0.0)
+            if blocked_until > now:
+                await asyncio.sleep(blocked_until - now)
+                continue
+
+            while bucket and bucket[0] <= now - self.per:
+                bucket.popleft()
+
+            if len(bucket) < self.rate:
+                bucket.append(now)
+                return
+
+            await asyncio.sleep(bucket[0] + self.per - now)
+
+    async def work(self, key: int, destination, queue: deque) -> None:
+        try:
+            while queue:
+                content, kwargs, futures = self.take(queue)
+                futures = [future for future in futures if not future.cancelled()]
+                if not futures:
+                    continue
+
+                try:
+                    message = await self.deliver(key, destination, content, kwargs)
+                except asyncio.CancelledError:
+                    for future in futures:
+                        future.cancel()
+                    raise
+                except Exception as error:
+                    for future in futures:
+                        if not future.done():
+                            future.set_exception(error)
+                else:
+                    for future in futures:
+                        if not future.done():
+                            future.set_result(message)
+        finally:
+            # anything still queued when the worker is cancelled is dropped
+            for _, _, _, future in queue:
+                future.cancel()
+            queue.clear()
+            del self.workers[key]
+            del self.queues[key]
+            # the bucket is still needed if the destination gets new messages within the window
+            self.forget_timers[key] = self.loop.call_later(self.per, self.forget, key)
+
+    def forget(self, key: int) -> None:
+        """drop rate limit state of an idle destination, once its window and a Retry-After are over"""
+        self.forget_timers.pop(key, None)
+        if key in self.workers:
+            return
+
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        remaining = max(bucket[-1] + self.per - now if bucket else 0.0, self.blocked_until.get(key, 0.0) - now)
+        if remaining > 0:
+            self.forget_timers[key] = self.loop.call_later(remaining, self.forget, key)
+            return
+
+        self.buckets.pop(key, None)
+        self.blocked_until.pop(key, None)
+
+    async def deliver(self, key: int, destination, content, kwargs: dict) -> discord.Message:
+        """one API call, retried after a 429"""
+        for attempt in range(self.max_retries + 1):
+            await self.acquire(key)
+            self.api_calls += 1
+
+            try:
+                return await destination.send(content, **kwargs)
+            except discord.HTTPException as error:
+                if error.status != 429 or attempt == self.max_retries:
+                    raise
+
+                self.rate_limited += 1
+                retry_after = float(error.response.headers.get('Retry-After', self.per))
+                logger.warning(f'rate limited sending to {key}, retrying in {retry_after:.2f}s')
+                self.blocked_until[key] = time.monotonic() + retry_after
+            finally:
+                self.settle(key)
+
+    def settle(self, key: int) -> None:
+        """move the token of the call that just ended to now
+
+        discord starts counting a message when the request arrives, which is after acquire() took the token;
+        counting from the response keeps the bucket from refilling before discord's does
+        """
+        bucket = self.buckets.get(key)
+        if bucket:
+            bucket[-1] = time.monotonic()
+
+    async def join(self) -> None:
+        """wait until every queued message was sent"""
+        while self.workers:
+            await asyncio.wait(list(self.workers.values()))
+
+    def cancel(self) -> None:
+        """drop all queued messages and stop the workers"""
+        for worker in list(self.workers.values()):
+            worker.cancel()
+
+    def stats(self) -> dict:
+        return {'submitted': self.submitted,
+                'api_calls': self.api_calls,
+                'coalesced': self.coalesced,
+                'rate_limited': self.rate_limited,
+                'queued': sum(len(queue) for queue in self.queues.values())}
@@ -0,0 +1,118 @@
+# imports
+import os
+import sys
+import time
+import signal
+import logging
+import subprocess
+from typing import Dict, List
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# sharding
+def shard_groups(shard_count: int, processes: int) -> List[List[int]]:
+    """split the shard ids into contiguous groups, one per process"""
+    processes = max(1, min(processes, shard_count))
+    size, rest = divmod(shard_count, processes)
+
+    groups = []
+    start = 0
+    for index in range(processes):
+        end = start + size + (1 if index < rest else 0)
+        groups.append(list(range(start, end)))
+        start = end
+
+    return groups
+
+
+class ShardSupervisor:
+    """runs every group of shards in its own subbot process (SHARD_MODE=processes) and restarts crashed ones
+
+    each worker is the subbot script itself, started with SHARD_MODE=auto and its SHARD_IDS. it opens its own
+    gateway connections and its own link to the main bot, and registers the guilds of its shards there, so the
+    main bot can route commands to the process owning the target. a worker that exits cleanly (e.g. SHUTDOWN from
+    the main bot) is not restarted; the supervisor returns once all workers exited
+    """
+    def __init__(self, script: str, shard_count: int, processes: int, start_delay: float = 5.0,
+                 metrics_port: int = 0, restart_delay: float = 5.0, max_restart_delay: float = 300.0):
+        self.script = os.path.abspath(script)
+        self.shard_count = shard_count
+        self.groups = shard_groups(shard_count, processes)
+        # discord allows one IDENTIFY per start_delay seconds
+        self.start_delay = start_delay
+        self.metrics_port = metrics_port
+        self.restart_delay = restart_delay
+        self.max_restart_delay = max_restart_delay
+
+        self.workers: Dict[int, subprocess.Popen] = {}
+        # worker index: number of restarts / time of the next restart
+        self.restarts: Dict[int, int] = {}
+        self.restart_at: Dict[int, float] = {}
+        self.stopping = False
+
+    def environment(self, index: int) -> dict:
+        environment = dict(os.environ,
+                           SHARD_MODE='auto',
+                           SHARD_COUNT=str(self.shard_count),
+                           SHARD_IDS=','.join(str(shard_id) for shard_id in self.groups[index]),
+                           # rotating one log file from several processes would lose lines
+                           LOG_FILE=f'logs/subbot-worker{index}.log')
+        if self.metrics_port:
+            environment['METRICS_PORT'] = str(self.metrics_port + index)
+
+        return environment
+
+    def spawn(self, index: int) -> None:
+        logger.info(f'starting worker {index} with shards {self.groups[index]} of {self.shard_count}')
+        self.workers[index] = subprocess.Popen([sys.executable, self.script], cwd=os.getcwd(),
+                                               env=self.environment(index))
+
+    def stop(self, signal_number=None, frame=None) -> None:
+        """terminate all workers, they close their connections and exit"""
+        self.stopping = True
+        self.restart_at.clear()
+        for process in self.workers.values():
+            if process.poll() is None:
+                process.terminate()
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        for index, group in enumerate(self.groups):
+            if self.stopping:
+                break
+            self.spawn(index)
+            # wait until the shards of this worker identified before the next one starts identifying
+            if index < len(self.groups) - 1:
+                time.sleep(self.start_delay * len(group))
+
+        while self.workers or self.restart_at:
+            time.sleep(0.5)
+            now = time.monotonic()
+
+            for index, process in list(self.workers.items()):
+                code = process.poll()
+                if code is None:
+                    continue
+
+                del self.workers[index]
+                if code == 0 or self.stopping:
+                    logger.info(f'worker {index} exited with code {code}')
+                    continue
+
+                self.restarts[index] = self.restarts.get(index, 0) + 1
+                delay = min(self.max_restart_delay, self.restart_delay * 2 ** (self.restarts[index] - 1))
+                logger.error(f'worker {index} exited with code {code}, restarting it in {delay:.0f}s')
+                self.restart_at[index] = now + delay
+
+            for index, restart_at in list(self.restart_at.items()):
+                if restart_at <= now:
+                    del self.restart_at[index]
+                    self.spawn(index)
+
+        logger.info('all workers exited')
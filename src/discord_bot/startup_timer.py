@@ -0,0 +1,46 @@
+# imports
+import time
+import logging
+import contextlib
+from typing import Dict
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# timer
+class StartupTimer:
+    """measures how long each phase of the startup takes and how long it took until a milestone was reached"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        # phase name: duration in seconds
+        self.phases: Dict[str, float] = {}
+        # milestone name: seconds since start
+        self.milestones: Dict[str, float] = {}
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """time the body of the with statement"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.phases[name] = time.perf_counter() - start
+            self.report(name)
+
+    def report(self, name: str) -> None:
+        """log the duration of a phase, again if it ended before logging was configured"""
+        logger.info(f'startup phase "{name}" took {self.phases[name] * 1000:.1f}ms')
+
+    def mark(self, name: str) -> float:
+        """record a milestone, returns the seconds since start"""
+        elapsed = time.perf_counter() - self.start
+        self.milestones.setdefault(name, elapsed)
+        logger.info(f'startup milestone "{name}" reached after {elapsed * 1000:.1f}ms')
+        return elapsed
+
+    def between(self, first: str, second: str) -> float:
+        """seconds between two milestones"""
+        return self.milestones[second] - self.milestones[first]
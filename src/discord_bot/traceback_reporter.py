@@ -0,0 +1,121 @@
+# imports
+import io
+import sys
+import time
+import asyncio
+import hashlib
+import logging
+import traceback
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+import discord
+
+
+# logging
+"""create logger by inheriting configuration from root logger"""
+logger = logging.getLogger(__name__)
+
+
+# discord limits
+EMBED_FIELD_VALUE_LIMIT = 1024
+EMBED_FIELD_LIMIT = 25
+EMBED_TOTAL_LIMIT = 6000
+# room for the code block markers around every chunk
+CODE_BLOCK_OVERHEAD = len('```py\n\n```')
+
+
+# reporter
+class TracebackReporter:
+    """turns unexpected errors into as few messages as possible, and repeated errors into one report
+
+    errors are fingerprinted by the type and the traceback frames of the exception they wrap. an error is reported
+    once per window; repeats within the window are only counted and mentioned in the next report of the same error.
+    formatting the traceback happens in a thread, not on the event loop
+    """
+    def __init__(self, window: float = 60.0, max_fingerprints: int = 256):
+        self.window = window
+        self.max_fingerprints = max_fingerprints
+        # fingerprint: [time of the last report, repeats since]
+        self.reports = OrderedDict()
+
+    @staticmethod
+    def unwrap(error: BaseException) -> BaseException:
+        """the exception that caused the error, discord.py wraps it into CommandInvokeError and the like"""
+        seen = set()
+        while id(error) not in seen:
+            seen.add(id(error))
+            cause = getattr(error, 'original', None) or error.__cause__
+            if cause is None:
+                break
+            error = cause
+        return error
+
+    @classmethod
+    def analyse(cls, error: BaseException) -> Tuple[str, str]:
+        """fingerprint and formatted traceback of an error; blocking, runs in a thread
+
+        the fingerprint is taken from the original exception: the traceback of the wrapper only holds the frames of
+        discord.py's invoke, which are the same for every command
+        """
+        original = cls.unwrap(error)
+        frames = traceback.extract_tb(original.__traceback__)
+        key = '|'.join([type(original).__module__, type(original).__qualname__] +
+                       [f'{frame.filename}:{frame.lineno}:{frame.name}' for frame in frames])
+
+        formatted = ''.join(traceback.format_exception(type(error), error, error.__traceback__))
+
+        return hashlib.sha1(key.encode('utf-8')).hexdigest(), formatted
+
+    async def prepare(self, error: BaseException) -> Optional[Tuple[str, int]]:
+        """formatted traceback and number of suppressed repeats, None if the error was reported within the window"""
+        loop = asyncio.get_event_loop()
+        fingerprint, formatted = await loop.run_in_executor(None, self.analyse, error)
+
+        now = time.monotonic()
+        report = self.reports.get(fingerprint)
+        if report is not None and now - report[0] < self.window:
+            report[1] += 1
+            logger.info(f'suppressing repeated {type(error).__name__} ({fingerprint[:8]}), '
+                        f'{report[1]} repeats since the last report')
+            return None
+
+        repeats = report[1] if report is not None else 0
+        self.reports[fingerprint] = [now, 0]
+        self.reports.move_to_end(fingerprint)
+        if len(self.reports) > self.max_fingerprints:
+            self.reports.popitem(last=False)
+
+        # print traceback
+        await loop.run_in_executor(None, sys.stderr.write, formatted)
+
+        return formatted, repeats
+
+    @staticmethod
+    def chunk(text: str, size: int) -> List[str]:
+        """split text into pieces of at most size characters, at line breaks where possible"""
+        chunks = []
+        while len(text) > size:
+            cut = text.rfind('\n', 0, size)
+            if cut <= 0:
+                cut = size
+            chunks.append(text[:cut])
+            text = text[cut:].lstrip('\n')
+
+        if text:
+            chunks.append(text)
+
+        return chunks
+
+    def attach(self, embed: discord.Embed, formatted: str) -> Optional[discord.File]:
+        """put the traceback into the embed if it fits into one message, otherwise return it as a file"""
+        chunks = self.chunk(formatted, EMBED_FIELD_VALUE_LIMIT - CODE_BLOCK_OVERHEAD)
+        needed = sum(len(chunk) + CODE_BLOCK_OVERHEAD + len('Traceback') for chunk in chunks)
+
+        if len(embed) + needed <= EMBED_TOTAL_LIMIT and len(embed.fields) + len(chunks) <= EMBED_FIELD_LIMIT:
+            for chunk in chunks:
+                embed.add_field(name='Traceback', value=f'```py\n{chunk}\n```', inline=False)
+            return None
+
+        embed.add_field(name='Traceback', value='attached as `traceback.txt`', inline=False)
+        return discord.File(io.BytesIO(formatted.encode('utf-8')), filename='traceback.txt')